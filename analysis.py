@@ -0,0 +1,430 @@
+"""批次分析逐試次匯出的資料
+
+一次載入多位參與者的試次（exporters.py 匯出的 CSV / Parquet / Arrow，或施測時存的
+<組別>.xlsx 活頁簿），以 NumPy 向量化的方式，同時為所有「參與者 × 階段 × 詞彙類型」
+擬合 ex-Gaussian 參數，並計算詞彙判斷與 PM 的訊號偵測指標（d′、criterion）：
+
+    python analysis.py <輸出前綴> <試次檔> [<試次檔> ...]
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 正確按鍵 → 詞彙類型（與 words_config 的預設鍵名一致）
+KEY_TYPES = {"a": "true", "l": "false", "space": "pm"}
+
+# 不同組別可能有同名的參與者，因此以組別與參與者一起區分
+GROUP_COLUMNS = ["group", "participant", "stage", "word_type"]
+
+# erfc 近似多項式係數（由低次到高次）
+ERFC_COEFFICIENTS = [
+    -1.26551223,
+    1.00002368,
+    0.37409196,
+    0.09678418,
+    -0.18628806,
+    0.27886807,
+    -1.13520398,
+    1.48851587,
+    -0.82215223,
+    0.17087277,
+]
+
+
+def read_workbook_trials(path):
+    """將 <組別>.xlsx 活頁簿（save_results_workbook 的格式）轉為逐試次的表格
+
+    每個工作表為一位參與者，每個階段一段：標題列之後每列一個試次，正確答案在
+    lexical_ans 或 phonetic_ans 欄。活頁簿沒有區塊邊界，同一階段重做或重複的
+    區塊接續寫在同一段，因此以該段 lexical_crate 的個數為區塊數、平均切分試次
+    （同一階段每個區塊的試次數相同）。block 依工作表中的階段順序編號，不一定是
+    施測順序；session 為該段的 time 欄，金額欄留空。
+    """
+    import openpyxl
+
+    group = os.path.splitext(os.path.basename(path))[0]
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    rows = []
+    for worksheet in workbook.worksheets:
+        block = 0
+        sections = []
+        for values in worksheet.iter_rows(values_only=True):
+            if values and values[0] == "time":
+                sections.append((values[1], []))
+            elif sections and values and values[2] is not None:
+                sections[-1][1].append(values)
+        for stage, section in sections:
+            session = section[0][0] if section else ""
+            blocks = sum(values[5] is not None for values in section)
+            if not blocks or len(section) % blocks:
+                raise ValueError(
+                    f"{path} 工作表 {worksheet.title} 的 {stage} 有 {len(section)} 個"
+                    f"試次與 {blocks} 個正確率，無法切分區塊"
+                )
+            size = len(section) // blocks
+            for index, values in enumerate(section):
+                if index % size == 0:
+                    block += 1
+                rows.append(
+                    {
+                        "participant": worksheet.title,
+                        "group": group,
+                        "session": str(session),
+                        "stage": stage,
+                        "block": block,
+                        "word": str(values[2]),
+                        "response": values[3] or "",
+                        "correct_response": values[4] or values[6] or "",
+                        "reaction_time": values[8],
+                        "balance": "",
+                    }
+                )
+    workbook.close()
+    return pd.DataFrame(rows)
+
+
+def load_trials(paths, key_types=KEY_TYPES):
+    """載入並合併試次檔，加上 word_type 與 correct 欄位"""
+    frames = []
+    for path in paths:
+        if path.endswith(".xlsx"):
+            frames.append(read_workbook_trials(path))
+        elif path.endswith(".parquet"):
+            frames.append(pd.read_parquet(path))
+        elif path.endswith(".arrow"):
+            import pyarrow as pa
+
+            with pa.memory_map(path) as source:
+                frames.append(pa.ipc.open_file(source).read_pandas())
+        else:
+            frames.append(
+                pd.read_csv(
+                    path,
+                    dtype={"response": str, "correct_response": str},
+                    keep_default_na=False,
+                )
+            )
+    trials = pd.concat(frames, ignore_index=True)
+    trials["group"] = trials["group"].astype(str)
+    trials["participant"] = trials["participant"].astype(str)
+    trials["reaction_time"] = pd.to_numeric(trials["reaction_time"], errors="coerce")
+    trials["word_type"] = trials["correct_response"].map(key_types)
+    trials["correct"] = trials["response"] == trials["correct_response"]
+    return trials
+
+
+def pad_groups(trials, value_column, group_columns=GROUP_COLUMNS):
+    """將各組的值排成 (組數, 最大組大小) 的矩陣，不足處填 NaN"""
+    grouped = trials.groupby(group_columns, sort=True, observed=True)
+    codes = grouped.ngroup().to_numpy()
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+    values = trials[value_column].to_numpy(dtype=float)[order]
+
+    sizes = np.bincount(codes)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    positions = np.arange(len(codes)) - starts[codes]
+
+    matrix = np.full((len(sizes), sizes.max() if len(sizes) else 0), np.nan)
+    matrix[codes, positions] = values
+    keys = grouped.size().reset_index()[group_columns]
+    return keys, matrix
+
+
+def log_erfc(x):
+    """log(erfc(x))，x 為正時在對數空間計算以避免下溢（Numerical Recipes erfcc）"""
+    ax = np.abs(x)
+    t = 1.0 / (1.0 + 0.5 * ax)
+    poly = np.zeros_like(t)
+    for coefficient in reversed(ERFC_COEFFICIENTS):
+        poly = poly * t + coefficient
+    log_tail = np.log(t) - ax * ax + poly  # log(erfc(|x|))
+    return np.where(x >= 0, log_tail, np.log(2.0 - np.exp(log_tail)))
+
+
+def log_norm_cdf(z):
+    return np.log(0.5) + log_erfc(-z / np.sqrt(2.0))
+
+
+def norm_ppf(p):
+    """標準常態分佈的反函數（Acklam 近似，相對誤差約 1e-9）"""
+    a = [-39.69683028665376, 220.9460984245205, -275.9285104469687,
+         138.3577518672690, -30.66479806614716, 2.506628277459239]  # fmt: skip
+    b = [-54.47609879822406, 161.5858368580409, -155.6989798598866,
+         66.80131188771972, -13.28068155288572]  # fmt: skip
+    c = [-0.007784894002430293, -0.3223964580411365, -2.400758277161838,
+         -2.549732539343734, 4.374664141464968, 2.938163982698783]  # fmt: skip
+    d = [0.007784695709041462, 0.3224671290700398, 2.445134137142996,
+         3.754408661907416]  # fmt: skip
+
+    p = np.asarray(p, dtype=float)
+    low = 0.02425
+    q = np.sqrt(-2 * np.log(np.where(p < 0.5, p, 1 - p)))
+    tail = (((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]) / (
+        (((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1
+    )
+    r = (p - 0.5) ** 2
+    central = (
+        (((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r + a[5])
+        * (p - 0.5)
+        / (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r + 1)
+    )
+    return np.where(
+        p < low, tail, np.where(p > 1 - low, -tail, central)
+    )  # 下尾為 tail，上尾對稱取負
+
+
+def exgauss_loglik(x, mu, sigma, tau):
+    """各組的 ex-Gaussian 對數概似總和；x 為含 NaN 的矩陣，參數為 (組數, 1)"""
+    z = (x - mu) / sigma - sigma / tau
+    logpdf = -np.log(tau) + (mu - x) / tau + sigma**2 / (2 * tau**2) + log_norm_cdf(z)
+    return np.nansum(logpdf, axis=1)
+
+
+def fit_exgauss_moments(x):
+    """動差法初始估計，所有組同時計算"""
+    n = np.sum(~np.isnan(x), axis=1)
+    mean = np.nanmean(x, axis=1)
+    sd = np.nanstd(x, axis=1)
+    safe_sd = np.where(sd > 0, sd, 1.0)
+    skew = np.nanmean(((x - mean[:, None]) / safe_sd[:, None]) ** 3, axis=1)
+    # ex-Gaussian 的偏態介於 0 與 2 之間
+    skew = np.clip(skew, 0.01, 1.99)
+    tau = sd * (skew / 2) ** (1 / 3)
+    mu = mean - tau
+    sigma = np.sqrt(np.maximum(sd**2 - tau**2, (0.1 * sd) ** 2))
+    return n, mu, np.maximum(sigma, 1.0), np.maximum(tau, 1.0)
+
+
+def exgauss_gradient(x, mu, sigma, tau):
+    """各組平均對數概似對 (mu, log sigma, log tau) 的解析梯度"""
+    z = (x - mu) / sigma - sigma / tau
+    # 逆 Mills 比 φ(z) / Φ(z)，在對數空間計算
+    mills = np.exp(-0.5 * z**2 - 0.5 * np.log(2 * np.pi) - log_norm_cdf(z))
+    d_mu = 1 / tau - mills / sigma
+    d_sigma = sigma / tau**2 - mills * ((x - mu) / sigma**2 + 1 / tau)
+    d_tau = -1 / tau + (x - mu) / tau**2 - sigma**2 / tau**3 + mills * sigma / tau**2
+    return np.stack(
+        [
+            np.nanmean(d_mu, axis=1),
+            np.nanmean(d_sigma, axis=1) * sigma[:, 0],
+            np.nanmean(d_tau, axis=1) * tau[:, 0],
+        ],
+        axis=1,
+    )
+
+
+def fit_exgauss(
+    x, max_iterations=3000, learning_rate=0.05, tolerance=1e-7, check_every=50
+):
+    """所有組同時以最大概似法擬合 ex-Gaussian
+
+    以動差法為初始值，對 (mu, log sigma, log tau) 使用 Adam 梯度上升；
+    每次迭代對尚未停止的組只做一次向量化的梯度計算，不對個別參與者迴圈。
+
+    每 check_every 次迭代檢查一次各組的平均對數概似：增加量小於 tolerance 時
+    該組回到目前最佳的參數並將步長縮小為四分之一（sigma 趨近 0 時峰值很窄，
+    固定步長的 Adam 會來回越過峰值）；步長縮小到原本的千分之一以下仍沒有
+    改善即視為收斂。到 max_iterations 仍在改善的組標記為未收斂。
+
+    回傳 (n, mu, sigma, tau, loglik, converged)，參數為檢查點中對數概似最高者。
+    """
+    n, mu, sigma, tau = fit_exgauss_moments(x)
+    valid = n >= 3
+    # 以各組的尺度標準化，讓所有組共用相同的學習率
+    scale = np.where(valid, sigma + tau, 1.0)[:, None]
+    params = np.stack(
+        [
+            np.where(valid, mu, 0.0) / scale[:, 0],
+            np.log(np.where(valid, sigma, 1.0) / scale[:, 0]),
+            np.log(np.where(valid, tau, 1.0) / scale[:, 0]),
+        ],
+        axis=1,
+    )
+    xs = x / scale
+    counts = np.maximum(n, 1)
+
+    def mean_loglik(rows, values):
+        loglik = exgauss_loglik(
+            xs[rows], values[:, 0:1], np.exp(values[:, 1:2]), np.exp(values[:, 2:3])
+        )
+        return np.where(np.isfinite(loglik), loglik / counts[rows], -np.inf)
+
+    first = np.zeros_like(params)
+    second = np.zeros_like(params)
+    steps = np.zeros(len(params))  # 各組自己的 Adam 步數（步長縮小時重新開始）
+    rates = np.full(len(params), float(learning_rate))
+    best = params.copy()
+    best_loglik = np.full(len(params), -np.inf)
+    best_loglik[valid] = mean_loglik(valid, params[valid])
+    converged = np.zeros(len(params), dtype=bool)
+    active = np.flatnonzero(valid)
+
+    for iteration in range(1, max_iterations + 1):
+        if not len(active):
+            break
+        current = params[active]
+        gradient = exgauss_gradient(
+            xs[active],
+            current[:, 0:1],
+            np.exp(current[:, 1:2]),
+            np.exp(current[:, 2:3]),
+        )
+        gradient = np.where(np.isfinite(gradient), gradient, 0.0)
+        steps[active] += 1
+        step = steps[active][:, None]
+        first[active] = 0.9 * first[active] + 0.1 * gradient
+        second[active] = 0.999 * second[active] + 0.001 * gradient**2
+        update = (first[active] / (1 - 0.9**step)) / (
+            np.sqrt(second[active] / (1 - 0.999**step)) + 1e-8
+        )
+        params[active] = current + rates[active][:, None] * update
+
+        if iteration % check_every:
+            continue
+        loglik = mean_loglik(active, params[active])
+        gain = loglik - best_loglik[active]
+        improved = active[gain > 0]
+        best[improved] = params[improved]
+        best_loglik[improved] = loglik[gain > 0]
+
+        stalled = active[gain < tolerance]
+        params[stalled] = best[stalled]
+        rates[stalled] /= 4
+        first[stalled] = second[stalled] = steps[stalled] = 0
+        finished = stalled[rates[stalled] < learning_rate * 1e-3]
+        converged[finished] = True
+        active = np.setdiff1d(active, finished)
+
+    mu = best[:, 0] * scale[:, 0]
+    sigma = np.exp(best[:, 1]) * scale[:, 0]
+    tau = np.exp(best[:, 2]) * scale[:, 0]
+    loglik = exgauss_loglik(x, mu[:, None], sigma[:, None], tau[:, None])
+    invalid = ~valid
+    mu[invalid] = sigma[invalid] = tau[invalid] = np.nan
+    return n, mu, sigma, tau, np.where(valid, loglik, np.nan), converged
+
+
+def exgauss_table(trials, correct_only=True, max_iterations=3000):
+    """每位參與者 × 階段 × 詞彙類型的 ex-Gaussian 參數
+
+    converged 為 False 的組在 max_iterations 內仍未收斂（常見於 sigma 趨近 0
+    的退化解），參數不應直接採用。
+    """
+    rts = trials[(trials["response"] != "") & trials["reaction_time"].notna()]
+    if correct_only:
+        rts = rts[rts["correct"]]
+    keys, matrix = pad_groups(rts, "reaction_time")
+    n, mu, sigma, tau, loglik, converged = fit_exgauss(
+        matrix, max_iterations=max_iterations
+    )
+    table = keys.copy()
+    table["n"] = n
+    table["mu"] = mu
+    table["sigma"] = sigma
+    table["tau"] = tau
+    table["mean_rt"] = np.nanmean(matrix, axis=1)
+    table["loglik"] = loglik
+    table["converged"] = converged  # 少於 3 個試次的組不擬合，參數為 NaN
+    return table
+
+
+def signal_detection(signal_hits, signal_total, noise_alarms, noise_total):
+    """log-linear 修正後的命中率、誤報率、d′ 與 criterion"""
+    hit_rate = (signal_hits + 0.5) / (signal_total + 1)
+    fa_rate = (noise_alarms + 0.5) / (noise_total + 1)
+    z_hit = norm_ppf(hit_rate)
+    z_fa = norm_ppf(fa_rate)
+    return hit_rate, fa_rate, z_hit - z_fa, -(z_hit + z_fa) / 2
+
+
+def sdt_table(trials, true_key="a", pm_key="space"):
+    """每位參與者 × 階段的訊號偵測指標
+
+    詞彙判斷：訊號為真詞，對真詞按真詞鍵為命中，對假詞按真詞鍵為誤報。
+    PM：訊號為 PM target，對 PM target 按空白鍵為命中，對其他詞按空白鍵為誤報。
+    """
+    frame = trials.assign(
+        is_true=trials["word_type"] == "true",
+        is_false=trials["word_type"] == "false",
+        is_pm=trials["word_type"] == "pm",
+        said_true=trials["response"] == true_key,
+        said_pm=trials["response"] == pm_key,
+    )
+    frame = frame.assign(
+        lexical_hit=frame["is_true"] & frame["said_true"],
+        lexical_fa=frame["is_false"] & frame["said_true"],
+        pm_hit=frame["is_pm"] & frame["said_pm"],
+        pm_fa=~frame["is_pm"] & frame["said_pm"],
+        is_filler=~frame["is_pm"],
+    )
+    counts = (
+        frame.groupby(["group", "participant", "stage"], sort=True)[
+            [
+                "is_true",
+                "is_false",
+                "is_pm",
+                "is_filler",
+                "lexical_hit",
+                "lexical_fa",
+                "pm_hit",
+                "pm_fa",
+            ]
+        ]
+        .sum()
+        .reset_index()
+    )
+
+    tables = []
+    for measure, hits, signal, alarms, noise in [
+        ("lexical", "lexical_hit", "is_true", "lexical_fa", "is_false"),
+        ("pm", "pm_hit", "is_pm", "pm_fa", "is_filler"),
+    ]:
+        hit_rate, fa_rate, d_prime, criterion = signal_detection(
+            counts[hits].to_numpy(float),
+            counts[signal].to_numpy(float),
+            counts[alarms].to_numpy(float),
+            counts[noise].to_numpy(float),
+        )
+        tables.append(
+            pd.DataFrame(
+                {
+                    "group": counts["group"],
+                    "participant": counts["participant"],
+                    "stage": counts["stage"],
+                    "measure": measure,
+                    "signal_trials": counts[signal],
+                    "noise_trials": counts[noise],
+                    "hit_rate": hit_rate,
+                    "fa_rate": fa_rate,
+                    "d_prime": d_prime,
+                    "criterion": criterion,
+                }
+            )
+        )
+    return pd.concat(tables, ignore_index=True)
+
+
+def main(argv):
+    if len(argv) < 3:
+        print("用法: python analysis.py <輸出前綴> <試次檔> [<試次檔> ...]")
+        return 1
+    trials = load_trials(argv[2:])
+    exgauss = exgauss_table(trials)
+    exgauss.to_csv(f"{argv[1]}_exgauss.csv", index=False)
+    unconverged = (~exgauss["converged"] & (exgauss["n"] >= 3)).sum()
+    if unconverged:
+        print(
+            f"Warning: {unconverged} 組的 ex-Gaussian 擬合未收斂"
+            "（converged 欄為 False），參數不可直接採用"
+        )
+    sdt_table(trials).to_csv(f"{argv[1]}_sdt.csv", index=False)
+    print(f"寫入 {argv[1]}_exgauss.csv 與 {argv[1]}_sdt.csv")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,95 @@
+import asyncio
+import datetime
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncTkRunner:
+    """讓 Tk mainloop 與 asyncio 事件迴圈交錯執行
+
+    Tk 仍是主迴圈；每隔 interval_ms 以 after() 執行一輪 asyncio（只處理已就緒的
+    callback，不會等待 I/O），因此每次佔用 Tk 的時間有上限。刺激呈現期間可呼叫
+    hold()，暫停 asyncio 並延後新的 I/O 工作直到 release()。
+    阻塞的 I/O（寫檔等）透過 run_io() 交給單一背景執行緒依序執行；hold() 之前
+    已開始的工作無法中斷，會在背景執行緒中繼續執行並與 Tk 競爭 GIL。需要完全
+    隔離時請使用程序執行器（main.py --realtime）。
+
+    背景工作失敗時將 traceback 附加到 error_log，並呼叫 on_error(exception)。
+    """
+
+    def __init__(self, root, interval_ms=10, executor=None, error_log=None):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.loop = asyncio.new_event_loop()
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.held = False
+        self.released = asyncio.Event()
+        self.released.set()
+        self.tasks = set()
+        self.error_log = error_log
+        self.on_error = None
+        self.failures = []
+
+    def hold(self):
+        """暫停 asyncio，讓 Tk 只處理刺激與按鍵；新的 I/O 工作等到 release() 才送出"""
+        self.held = True
+        self.released.clear()
+
+    def release(self):
+        self.held = False
+        self.released.set()
+
+    def submit(self, coroutine):
+        """在 asyncio 迴圈中排程協程，回傳 Task"""
+        task = self.loop.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.task_done)
+        return task
+
+    def task_done(self, task):
+        self.tasks.discard(task)
+        if task.cancelled() or task.exception() is None:
+            return
+        exception = task.exception()
+        print(f"Background task failed: {exception!r}")
+        self.failures.append(exception)
+        if self.error_log:
+            with open(self.error_log, "a", encoding="utf-8") as file:
+                file.write(
+                    f"[{datetime.datetime.now().isoformat(timespec='seconds')}] "
+                )
+                file.writelines(traceback.format_exception(exception))
+        if self.on_error is not None:
+            self.on_error(exception)
+
+    async def run_io(self, func, *args):
+        """在背景執行緒執行阻塞函式，依提交順序完成；hold() 期間延後送出"""
+        await self.released.wait()
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    def run_once(self):
+        """執行一輪 asyncio：只處理已就緒的 callback 與 I/O 事件"""
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+
+    def tick(self):
+        if not self.held:
+            self.run_once()
+        self.root.after(self.interval_ms, self.tick)
+
+    def run(self):
+        """取代 root.mainloop()；視窗關閉後完成尚未結束的背景工作"""
+        self.root.after(self.interval_ms, self.tick)
+        self.root.mainloop()
+        self.drain()
+
+    def drain(self):
+        """等待所有背景工作完成後關閉迴圈與執行緒
+
+        視窗在刺激呈現中關閉時 hold() 尚未解除，先 release() 以免 run_io 永遠等待。
+        """
+        self.release()
+        while self.tasks:
+            self.loop.run_until_complete(asyncio.wait(set(self.tasks)))
+        self.executor.shutdown(wait=True)
+        self.loop.close()
@@ -0,0 +1,323 @@
+"""資料路徑效能測試
+
+以合成的 words_config 與試次資料，量測 create_word_list、load_words_from_config、
+save_stage_results、save_results 與其他匯出後端在不同規模下的時間與記憶體峰值，
+結果寫成 JSON，可與其他版本的結果比較：
+
+    python benchmarks/bench_data_path.py --output new.json
+    python benchmarks/bench_data_path.py --quick --compare old.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from exporters import ArrowTrialExporter, CsvTrialExporter, pa  # noqa: E402
+from main import LanguageProcessingTestSystem  # noqa: E402
+from session import STAGE_SPECS, TrialRecord  # noqa: E402
+
+STAGES = ["practice", "formal", "reward", "penalty", "reward_penalty"]
+
+WORD_COUNTS = [10, 100, 1000, 10000, 50000]
+SHEET_COUNTS = [1, 10, 100, 500]
+QUICK_WORD_COUNTS = [10, 100, 1000]
+QUICK_SHEET_COUNTS = [1, 10]
+
+
+def make_stage_words(stage, total_words, rng):
+    """產生一個階段的合成詞彙：約 10% 為 PM target，其餘真假詞各半"""
+    pm_count = max(1, total_words // 10)
+    filler_count = total_words - pm_count
+    positions = rng.sample(range(1, total_words + 1), pm_count)
+    return {
+        "a": [f"{stage}a{i}" for i in range(filler_count // 2)],
+        "l": [f"{stage}l{i}" for i in range(filler_count - filler_count // 2)],
+        "space": {f"{stage}s{i}": pos for i, pos in enumerate(positions)},
+    }
+
+
+def make_words_config(total_words, rng):
+    return {
+        "types": {stage: make_stage_words(stage, total_words, rng) for stage in STAGES}
+    }
+
+
+def make_app(words_config, marathon=False):
+    """以不建立畫面的建構方式取得應用程式，只使用資料路徑
+
+    試次匯出器在 start_experiment 才建立，因此不會寫入任何試次檔。
+    """
+    app = LanguageProcessingTestSystem(
+        None,
+        words_config=words_config["types"],
+        export_formats=["csv"] if marathon else [],
+        marathon=marathon,
+    )
+    app.participant_name = "bench"
+    app.group = "bench"
+    app.current_balance = 200
+    return app
+
+
+def fill_stage(app, stage, rng):
+    """編譯階段並填入合成的作答結果，模擬階段剛結束時的狀態"""
+    app.current_stage = stage
+    app.current_block = app.compile_stage_block(stage)
+    app.current_balance = STAGE_SPECS[stage].initial_balance
+    events = app.current_block.events
+    for event in events:
+        app.current_event = event
+        response = rng.choice(["a", "l", "space", ""])
+        app.record_trial(stage, TrialRecord(event, response, rng.randint(300, 3000)))
+        if event.accum_key:
+            app.record_balance(event.accum_key)
+    app.true_word_count = app.false_word_count = len(events) // 2
+    app.true_word_correct = app.false_word_correct = len(events) // 4
+    app.pm_target_count = app.pm_target_correct = 1
+
+
+def make_trial_rows(total_words, rng):
+    return [
+        {
+            "participant": "bench",
+            "group": "bench",
+            "session": "bench",
+            "stage": "nofb",
+            "block": 1,
+            "word": f"w{i}",
+            "response": rng.choice(["a", "l", "space", ""]),
+            "correct_response": rng.choice(["a", "l", "space"]),
+            "reaction_time": rng.randint(300, 3000),
+            "balance": "",
+            "gc_pause_ms": "",
+        }
+        for i in range(total_words)
+    ]
+
+
+def measure(func, setup, repeats):
+    """回傳 (最短秒數, tracemalloc 峰值 bytes)；setup 不計時，回傳值傳給 func"""
+    timings = []
+    for _ in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            state = setup()
+            start = time.perf_counter()
+            func(state)
+            timings.append(time.perf_counter() - start)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        state = setup()
+        tracemalloc.start()
+        func(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+def bench_create_word_list(total_words, repeats, rng):
+    config = make_words_config(total_words, rng)
+
+    def setup():
+        app = make_app(config)
+        app.select_words_for_stage("formal")
+        return app
+
+    return measure(lambda app: app.create_word_list(), setup, repeats)
+
+
+def bench_load_words_from_config(total_words, repeats, rng, work_dir):
+    path = os.path.join(work_dir, f"config_{total_words}.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(make_words_config(total_words, rng), file, ensure_ascii=False)
+    app = make_app(make_words_config(10, rng))
+    return measure(lambda _: app.load_words_from_config(path), lambda: None, repeats)
+
+
+def bench_save_stage_results(total_words, repeats, rng, marathon=False):
+    """階段結束的存檔；marathon 為 True 時量測馬拉松模式只保存彙整的路徑"""
+    config = make_words_config(total_words, rng)
+
+    def setup():
+        app = make_app(config, marathon)
+        fill_stage(app, "reward", random.Random(0))
+        return app
+
+    return measure(lambda app: app.save_stage_results(), setup, repeats)
+
+
+def bench_save_results(sheet_count, total_words, repeats, rng, work_dir):
+    """群組活頁簿已有 sheet_count 個參與者工作表時，再寫入一位參與者"""
+    import openpyxl
+
+    config = make_words_config(total_words, rng)
+    template = os.path.join(work_dir, f"template_{sheet_count}.xlsx")
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for index in range(sheet_count):
+        worksheet = workbook.create_sheet(title=f"p{index}")
+        for row in range(total_words * len(STAGES)):
+            worksheet.append([row, f"w{row}", "a", "a", "", "", "", 500])
+    workbook.save(template)
+
+    def setup():
+        app = make_app(config)
+        app.group = os.path.join(work_dir, "group")
+        with open(template, "rb") as source, open(f"{app.group}.xlsx", "wb") as target:
+            target.write(source.read())
+        state_rng = random.Random(0)
+        for stage in STAGES:
+            fill_stage(app, stage, state_rng)
+            app.save_stage_results()
+        return app
+
+    return measure(lambda app: app.save_results(), setup, repeats)
+
+
+def bench_exporter(backend, total_words, repeats, rng, work_dir):
+    rows = make_trial_rows(total_words, rng)
+
+    def setup():
+        path = os.path.join(work_dir, f"trials.{backend}")
+        if os.path.exists(path):
+            os.remove(path)
+        if backend == "csv":
+            return CsvTrialExporter(path)
+        return ArrowTrialExporter(path, backend)
+
+    def run(exporter):
+        for stage_rows in (rows[i : i + 1000] for i in range(0, len(rows), 1000)):
+            exporter.write_rows(stage_rows)
+        exporter.close()
+
+    return measure(run, setup, repeats)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_benchmarks(word_counts, sheet_counts, repeats, seed=0):
+    rng = random.Random(seed)
+    results = []
+
+    def record(name, size, outcome, **extra):
+        seconds, peak = outcome
+        results.append(
+            dict(name=name, size=size, seconds=seconds, peak_bytes=peak, **extra)
+        )
+        print(
+            f"{name:<28} size={size:<6} {seconds * 1000:10.2f} ms {peak / 1024:10.1f} KiB"
+        )
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        backends = ["csv"] + (["parquet", "arrow"] if pa is not None else [])
+        for total_words in word_counts:
+            record(
+                "create_word_list",
+                total_words,
+                bench_create_word_list(total_words, repeats, rng),
+            )
+            record(
+                "load_words_from_config",
+                total_words,
+                bench_load_words_from_config(total_words, repeats, rng, work_dir),
+            )
+            record(
+                "save_stage_results",
+                total_words,
+                bench_save_stage_results(total_words, repeats, rng),
+            )
+            record(
+                "save_stage_results_marathon",
+                total_words,
+                bench_save_stage_results(total_words, repeats, rng, marathon=True),
+            )
+            for backend in backends:
+                record(
+                    f"export_{backend}",
+                    total_words,
+                    bench_exporter(backend, total_words, repeats, rng, work_dir),
+                )
+        for sheet_count in sheet_counts:
+            record(
+                "save_results",
+                sheet_count,
+                bench_save_results(sheet_count, 10, repeats, rng, work_dir),
+                words_per_stage=10,
+            )
+
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeats": repeats,
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    """列出與舊結果相比的時間比值（>1 表示變慢）"""
+    old = {(r["name"], r["size"]): r for r in baseline["results"]}
+    print(f"\ncompare with {baseline.get('revision') or 'baseline'}:")
+    for result in current["results"]:
+        previous = old.get((result["name"], result["size"]))
+        if previous is None or not previous["seconds"]:
+            continue
+        ratio = result["seconds"] / previous["seconds"]
+        memory_ratio = (
+            result["peak_bytes"] / previous["peak_bytes"]
+            if previous["peak_bytes"]
+            else float("nan")
+        )
+        print(
+            f"{result['name']:<28} size={result['size']:<6}"
+            f" time x{ratio:6.2f}  memory x{memory_ratio:6.2f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="先前輸出的 JSON，用來比較")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="只跑較小的規模")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        QUICK_WORD_COUNTS if args.quick else WORD_COUNTS,
+        QUICK_SHEET_COUNTS if args.quick else SHEET_COUNTS,
+        args.repeats,
+    )
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=4)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            compare(json.load(file), report)
+
+
+if __name__ == "__main__":
+    main()
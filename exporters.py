@@ -0,0 +1,205 @@
+import csv
+import os
+
+try:  # Parquet / Arrow IPC 為選用功能，需要 pyarrow
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pa_ipc = None
+    pq = None
+
+# 每一列代表一個試次
+TRIAL_FIELDS = [
+    "participant",
+    "group",
+    "session",  # 施測識別：開始施測的時間，同名參與者重新施測時不同
+    "stage",
+    "block",  # 區塊序號：該次施測的第幾個區塊，重做或重複的階段各自不同
+    "word",
+    "response",
+    "correct_response",
+    "reaction_time",
+    "balance",
+    "gc_pause_ms",  # 試次前黑屏期間手動回收的時間（GC 安靜模式）
+]
+
+# 數值欄位中的空字串在 Parquet / Arrow 中寫成 null
+NUMERIC_FIELDS = ("reaction_time", "balance", "gc_pause_ms")
+
+
+class CsvTrialExporter:
+    """以 CSV 逐階段附加試次資料，同組別的參與者寫入同一個檔案"""
+
+    def __init__(self, path):
+        self.path = path
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        fieldnames = TRIAL_FIELDS
+        if not write_header:
+            # 舊版建立的檔案沿用原本的欄位，避免同一檔案中欄位數不一致
+            with open(path, "r", encoding="utf-8", newline="") as file:
+                fieldnames = next(csv.reader(file), TRIAL_FIELDS)
+            if fieldnames != TRIAL_FIELDS:
+                print(
+                    f"Warning: {path} 的欄位與目前版本不同，"
+                    f"缺少的欄位 {sorted(set(TRIAL_FIELDS) - set(fieldnames))} 不會寫入"
+                )
+        self.file = open(path, "a", encoding="utf-8", newline="")
+        self.writer = csv.DictWriter(
+            self.file, fieldnames=fieldnames, extrasaction="ignore"
+        )
+        if write_header:
+            self.writer.writeheader()
+            self.file.flush()
+
+    def write_rows(self, rows):
+        """附加一個階段的試次，寫入後立即 flush 到磁碟"""
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class ArrowTrialExporter:
+    """以 Parquet 或 Arrow IPC 檔案逐階段附加試次資料（每階段一個 row group / batch）"""
+
+    def __init__(self, path, file_format="parquet"):
+        if pa is None:
+            raise RuntimeError("匯出 Parquet / Arrow 需要安裝 pyarrow：pip install pyarrow")
+        if file_format not in ("parquet", "arrow"):
+            raise ValueError(f"未知的匯出格式: {file_format}")
+
+        self.path = path
+        self.file_format = file_format
+        self.schema = pa.schema(
+            [
+                ("participant", pa.string()),
+                ("group", pa.string()),
+                ("session", pa.string()),
+                ("stage", pa.string()),
+                ("block", pa.int32()),
+                ("word", pa.string()),
+                ("response", pa.string()),
+                ("correct_response", pa.string()),
+                ("reaction_time", pa.int32()),
+                ("balance", pa.int32()),
+                ("gc_pause_ms", pa.float64()),
+            ]
+        )
+        if file_format == "parquet":
+            self.writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self.sink = pa.OSFile(path, "wb")
+            self.writer = pa_ipc.new_file(self.sink, self.schema)
+
+    def write_rows(self, rows):
+        """將一個階段的試次寫成一個批次"""
+        if not rows:
+            return
+        columns = {
+            field: [
+                None
+                if row[field] == "" and field in NUMERIC_FIELDS
+                else row[field]
+                for row in rows
+            ]
+            for field in TRIAL_FIELDS
+        }
+        batch = pa.RecordBatch.from_pydict(columns, schema=self.schema)
+        if self.file_format == "parquet":
+            self.writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+
+    def close(self):
+        """關閉檔案並寫入 footer，之後即可用 memory map 讀取"""
+        if self.writer is None:
+            return
+        self.writer.close()
+        if self.file_format == "arrow":
+            self.sink.close()
+        self.writer = None
+
+
+# DeferredTrialExporter 在各程序中實際開啟的匯出器：路徑 → 匯出器
+_process_exporters = {}
+
+
+class DeferredTrialExporter:
+    """只記錄路徑與格式的匯出器代理，可 pickle 後交給背景程序
+
+    第一次 write_rows 時才在執行的程序中開啟真正的匯出器，之後同一程序中
+    相同路徑的代理共用該檔案，因此檔案只會在背景程序中開啟與寫入。
+    """
+
+    def __init__(self, path, file_format):
+        self.path = path
+        self.file_format = file_format
+
+    def open(self):
+        exporter = _process_exporters.get(self.path)
+        if exporter is None:
+            if self.file_format == "csv":
+                exporter = CsvTrialExporter(self.path)
+            else:
+                exporter = ArrowTrialExporter(self.path, self.file_format)
+            _process_exporters[self.path] = exporter
+        return exporter
+
+    def write_rows(self, rows):
+        self.open().write_rows(rows)
+
+    def close(self):
+        exporter = _process_exporters.pop(self.path, None)
+        if exporter is not None:
+            exporter.close()
+
+
+def create_trial_exporters(
+    group,
+    participant_name,
+    formats,
+    output_dir=".",
+    open_exporters=None,
+    deferred=False,
+):
+    """根據格式清單建立匯出器
+
+    CSV 以組別為單位持續附加；Parquet / Arrow 檔案寫完 footer 後無法再附加，
+    因此每位參與者各自一個檔案。若提供 open_exporters（路徑 → 匯出器），
+    CSV 匯出器會放入其中並在下一位參與者時重複使用。deferred=True 時回傳
+    DeferredTrialExporter，檔案延後到實際寫入的程序中才開啟。
+    """
+
+    def make_exporter(path, file_format):
+        if deferred:
+            if file_format != "csv" and pa is None:
+                raise RuntimeError(
+                    "匯出 Parquet / Arrow 需要安裝 pyarrow：pip install pyarrow"
+                )
+            return DeferredTrialExporter(path, file_format)
+        if file_format == "csv":
+            return CsvTrialExporter(path)
+        return ArrowTrialExporter(path, file_format)
+
+    exporters = []
+    for file_format in formats:
+        if file_format == "csv":
+            path = os.path.join(output_dir, f"{group}_trials.csv")
+            if open_exporters is None:
+                exporters.append(make_exporter(path, file_format))
+                continue
+            if path not in open_exporters:
+                open_exporters[path] = make_exporter(path, file_format)
+            exporters.append(open_exporters[path])
+        elif file_format in ("parquet", "arrow"):
+            path = os.path.join(
+                output_dir, f"{group}_{participant_name}_trials.{file_format}"
+            )
+            exporters.append(make_exporter(path, file_format))
+        else:
+            raise ValueError(f"未知的匯出格式: {file_format}")
+    return exporters
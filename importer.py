@@ -0,0 +1,229 @@
+"""由 Excel / CSV 詞彙表產生 words_config
+
+逐列串流讀取（.xlsx 使用 openpyxl read-only 模式，.csv 使用 csv 模組），詞彙以
+NFKC 正規化全形／半形字元並整理空白後，以雜湊表去除重複，再依「階段」欄或
+分配規則放入五個階段，輸出通過 session.validate_types 檢查的 types 區塊：
+
+    python importer.py 詞彙表.xlsx words_config.json [--sheet 工作表] [--rule hash]
+
+詞彙表需要有標題列，欄位為 word（詞彙）、type（a / l / space 或 真詞 / 假詞 / PM）、
+選用的 stage（階段名稱或前綴，例如 reward 或 rfb）與 position（PM target 位置）。
+"""
+
+import argparse
+import csv
+import json
+import random
+import re
+import sys
+import unicodedata
+import zlib
+
+from session import STAGE_SPECS, validate_types
+
+# 輸出的鍵名（與 words_config.json 相同：真詞、假詞、PM target）
+WORD_TYPES = ("a", "l", "space")
+
+# type 欄位可接受的寫法
+TYPE_ALIASES = {
+    "a": "a",
+    "true": "a",
+    "word": "a",
+    "1": "a",
+    "真詞": "a",
+    "l": "l",
+    "false": "l",
+    "nonword": "l",
+    "0": "l",
+    "假詞": "l",
+    "space": "space",
+    "pm": "space",
+    "target": "space",
+    "pm target": "space",
+}
+
+# stage 欄位可接受階段名稱或 summary_data 前綴
+STAGE_ALIASES = dict(
+    [(stage, stage) for stage in STAGE_SPECS]
+    + [(spec.prefix, stage) for stage, spec in STAGE_SPECS.items()]
+)
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_word(text):
+    """全形英數與空白轉半形（NFKC），連續空白合併為一個並去除頭尾空白"""
+    if text is None:
+        return ""
+    return WHITESPACE.sub(" ", unicodedata.normalize("NFKC", str(text))).strip()
+
+
+def normalize_label(text):
+    return normalize_word(text).lower()
+
+
+def iter_sheet_rows(path, sheet=None):
+    """逐列讀取詞彙表，第一列為標題；回傳 (列號, {欄位: 值}) 的迭代器"""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            worksheet = workbook[sheet] if sheet else workbook.active
+            rows = worksheet.iter_rows(values_only=True)
+            header = [normalize_label(cell) for cell in next(rows, ())]
+            for number, row in enumerate(rows, start=2):
+                yield number, dict(zip(header, row))
+        finally:
+            workbook.close()
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as file:
+            reader = csv.reader(file)
+            header = [normalize_label(cell) for cell in next(reader, [])]
+            for number, row in enumerate(reader, start=2):
+                yield number, dict(zip(header, row))
+
+
+def hash_rule(word, word_type, counters):
+    """依詞彙的 CRC32 分配階段：與列的順序無關，詞彙表增加新列時舊詞不會換階段"""
+    stages = list(STAGE_SPECS)
+    return stages[zlib.crc32(word.encode("utf-8")) % len(stages)]
+
+
+def round_robin_rule(word, word_type, counters):
+    """各類型依出現順序輪流分配到五個階段，使各階段數量平均"""
+    stages = list(STAGE_SPECS)
+    index = counters.get(word_type, 0)
+    counters[word_type] = index + 1
+    return stages[index % len(stages)]
+
+
+RULES = {"round_robin": round_robin_rule, "hash": hash_rule}
+
+
+def import_words(rows, rule=round_robin_rule, seed=0):
+    """將詞彙列整理成 types 區塊
+
+    rows 為 (列號, {欄位: 值}) 的迭代器；沒有 stage 欄位的列由 rule 決定階段。
+    同一個詞只保留第一次出現（不分階段），類型衝突的重複列記錄在報告中。
+    沒有指定位置的 PM target 以 seed 隨機安排在該階段未被佔用的位置。
+
+    回傳 (types, report)，report 記錄各種被略過的列。
+    """
+    types = {stage: {key: [] for key in WORD_TYPES} for stage in STAGE_SPECS}
+    positions = {stage: {} for stage in STAGE_SPECS}
+    first_seen = {}  # 正規化後的詞 → (階段, 類型, 列號)
+    counters = {}
+    report = {
+        "rows": 0,
+        "blank": [],
+        "duplicates": 0,
+        "conflicts": [],
+        "unknown_type": [],
+        "unknown_stage": [],
+        "bad_position": [],
+    }
+
+    for number, row in rows:
+        report["rows"] += 1
+        word = normalize_word(row.get("word"))
+        if not word:
+            report["blank"].append(number)
+            continue
+        word_type = TYPE_ALIASES.get(normalize_label(row.get("type")))
+        if word_type is None:
+            report["unknown_type"].append(number)
+            continue
+
+        if word in first_seen:
+            stage, seen_type, seen_number = first_seen[word]
+            if seen_type == word_type:
+                report["duplicates"] += 1
+            else:
+                report["conflicts"].append((number, word, seen_number))
+            continue
+
+        stage_label = normalize_label(row.get("stage"))
+        if stage_label:
+            stage = STAGE_ALIASES.get(stage_label)
+            if stage is None:
+                report["unknown_stage"].append(number)
+                continue
+        else:
+            stage = rule(word, word_type, counters)
+
+        first_seen[word] = (stage, word_type, number)
+        if word_type == "space":
+            position = row.get("position")
+            if position in (None, ""):
+                position = None
+            else:
+                try:
+                    position = int(float(position))
+                except ValueError:
+                    report["bad_position"].append(number)
+                    position = None
+            positions[stage][word] = position
+        else:
+            types[stage][word_type].append(word)
+
+    rng = random.Random(seed)
+    for stage, targets in positions.items():
+        total_words = sum(len(types[stage][key]) for key in WORD_TYPES[:2])
+        total_words += len(targets)
+        taken = {pos for pos in targets.values() if pos is not None}
+        free = [pos for pos in range(1, total_words + 1) if pos not in taken]
+        rng.shuffle(free)
+        types[stage]["space"] = {
+            word: pos if pos is not None else free.pop()
+            for word, pos in targets.items()
+        }
+    return types, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="由 Excel / CSV 詞彙表產生 words_config"
+    )
+    parser.add_argument("source", help="詞彙表（.xlsx 或 .csv）")
+    parser.add_argument("output", help="輸出的 words_config.json")
+    parser.add_argument("--sheet", help="Excel 工作表名稱（預設為第一個）")
+    parser.add_argument(
+        "--rule",
+        choices=sorted(RULES),
+        default="round_robin",
+        help="沒有 stage 欄位時的階段分配規則",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="PM target 位置的亂數種子")
+    args = parser.parse_args(argv)
+
+    types, report = import_words(
+        iter_sheet_rows(args.source, args.sheet), RULES[args.rule], args.seed
+    )
+    print(
+        f"讀取 {report['rows']} 列，重複 {report['duplicates']} 列，"
+        f"空白 {len(report['blank'])} 列"
+    )
+    for key, label in [
+        ("conflicts", "類型與先前不同的重複詞（列號, 詞, 首次出現列號）"),
+        ("unknown_type", "無法辨識 type 的列"),
+        ("unknown_stage", "無法辨識 stage 的列"),
+        ("bad_position", "位置無法辨識、改為隨機安排的列"),
+    ]:
+        if report[key]:
+            print(
+                f"{label}: {report[key][:20]}{' ...' if len(report[key]) > 20 else ''}"
+            )
+
+    errors = validate_types(types)
+    if errors:
+        print("\n".join(errors))
+        return 1
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump({"types": types}, file, ensure_ascii=False, indent=4)
+    print(f"寫入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+import sqlite3
+import sys
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    participant TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    session TEXT NOT NULL,           -- 施測識別（開始施測的時間），舊資料為空字串
+    block INTEGER NOT NULL,          -- 該次施測的區塊序號，舊資料為 0
+    stage TEXT NOT NULL,             -- 階段前綴: prac / nofb / rfb / pfb / rpfb
+    word TEXT NOT NULL,
+    correct_response TEXT NOT NULL,  -- 詞彙類型: a / l / space
+    response TEXT NOT NULL,          -- 空字串表示超時
+    correct INTEGER NOT NULL,
+    reaction_time INTEGER
+);
+CREATE INDEX IF NOT EXISTS trials_block
+    ON trials (participant, group_name, session, block, stage);
+CREATE INDEX IF NOT EXISTS trials_word
+    ON trials (word, stage, correct_response, reaction_time);
+CREATE TABLE IF NOT EXISTS items (
+    stage TEXT NOT NULL,
+    word TEXT NOT NULL,
+    correct_response TEXT NOT NULL,
+    trials INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    responded INTEGER NOT NULL,      -- 有按鍵的試次數（RT 統計只計這些）
+    rt_sum INTEGER NOT NULL,
+    rt_square_sum INTEGER NOT NULL,
+    PRIMARY KEY (stage, word, correct_response)
+);
+CREATE INDEX IF NOT EXISTS items_accuracy
+    ON items (stage, correct_response);
+"""
+
+# 由 trials 計算單一 (詞彙, 詞彙類型) 彙整值的欄位
+AGGREGATE_COLUMNS = (
+    "word, correct_response, COUNT(*), SUM(correct), COUNT(reaction_time),"
+    " IFNULL(SUM(reaction_time), 0), IFNULL(SUM(reaction_time * reaction_time), 0)"
+)
+
+# 選取單一區塊試次的條件，參數順序同 add_rows 的區塊鍵
+BLOCK_FILTER = (
+    "participant = ? AND group_name = ? AND session = ? AND block = ? AND stage = ?"
+)
+
+
+class ItemIndex:
+    """以詞彙 × 階段 × 詞彙類型彙整所有已存檔試次的 SQLite 索引
+
+    每次存檔只以該區塊的增量更新彙整，不需重新掃描所有工作表或歷史試次。試次以
+    (參與者, 組別, 施測識別, 區塊序號, 階段) 區分區塊：重做的練習、重複的階段與同名
+    參與者的再次施測各自計入，只有相同區塊再次寫入時（例如重新 build 同一個匯出檔）
+    才取代舊的試次。
+    """
+
+    def __init__(self, db_path):
+        self.connection = sqlite3.connect(db_path)
+        self.upgrade_trials()
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def upgrade_trials(self):
+        """舊版索引的 trials 沒有施測識別與區塊序號，補上這兩個欄位（舊資料為 '' 與 0）"""
+        columns = [
+            row[1] for row in self.connection.execute("PRAGMA table_info(trials)")
+        ]
+        if not columns or "session" in columns:
+            return
+        with self.connection:
+            self.connection.execute("DROP INDEX IF EXISTS trials_session")
+            self.connection.execute("DROP INDEX IF EXISTS trials_word")
+            self.connection.execute("ALTER TABLE trials RENAME TO old_trials")
+            self.connection.executescript(SCHEMA)
+            self.connection.execute(
+                "INSERT INTO trials SELECT participant, group_name, '', 0, stage, word,"
+                " correct_response, response, correct, reaction_time FROM old_trials"
+            )
+            self.connection.execute("DROP TABLE old_trials")
+
+    def add_rows(self, rows, replace=True):
+        """加入試次匯出格式的列（見 exporters.TRIAL_FIELDS），依區塊分批更新
+
+        replace 為 False 時只附加，不取代同一區塊已寫入的試次（馬拉松模式分批
+        寫入同一區塊時使用）。沒有 session / block 欄位的舊版匯出列視為 '' 與 0。
+        """
+        blocks = {}
+        for row in rows:
+            key = (
+                str(row["participant"]),
+                str(row["group"]),
+                str(row.get("session", "")),
+                int(row.get("block", 0)),
+                row["stage"],
+            )
+            blocks.setdefault(key, []).append(row)
+        with self.connection:
+            for block, block_rows in blocks.items():
+                self.replace_block(block, block_rows, replace)
+
+    def replace_block(self, block, rows, replace=True):
+        """寫入 block = (參與者, 組別, 施測識別, 區塊序號, 階段) 的試次並更新彙整"""
+        stage = block[4]
+        old = []
+        if replace:
+            old = self.remove_block(block)
+
+        records = [
+            (
+                row["word"],
+                row["correct_response"],
+                row["response"],
+                int(row["response"] == row["correct_response"]),
+                int(row["reaction_time"]) if row["response"] else None,
+            )
+            for row in rows
+        ]
+        self.connection.executemany(
+            "INSERT INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (block + record for record in records),
+        )
+
+        totals = {}
+        for word, key, _, correct, reaction_time in records:
+            total = totals.setdefault((word, key), [0, 0, 0, 0, 0])
+            total[0] += 1
+            total[1] += correct
+            if reaction_time is not None:
+                total[2] += 1
+                total[3] += reaction_time
+                total[4] += reaction_time * reaction_time
+        self.merge_items(stage, [key + tuple(total) for key, total in totals.items()])
+        if old:
+            # 取代後不再出現的詞彙
+            self.connection.execute(
+                "DELETE FROM items WHERE stage = ? AND trials <= 0", (stage,)
+            )
+
+    def remove_block(self, block):
+        """扣除同一區塊舊試次對彙整的貢獻並刪除，回傳舊的彙整值"""
+        stage = block[4]
+        old = self.connection.execute(
+            f"SELECT {AGGREGATE_COLUMNS} FROM trials WHERE {BLOCK_FILTER}"
+            " GROUP BY word, correct_response",
+            block,
+        ).fetchall()
+        self.merge_items(
+            stage,
+            [
+                (word, key, -count, -correct, -responded, -rt_sum, -rt_square_sum)
+                for word, key, count, correct, responded, rt_sum, rt_square_sum in old
+            ],
+        )
+        self.connection.execute(f"DELETE FROM trials WHERE {BLOCK_FILTER}", block)
+        return old
+
+    def merge_items(self, stage, deltas):
+        """將 (詞彙, 詞彙類型, 試次, 正確, 有按鍵, RT 和, RT 平方和) 的增量加入彙整"""
+        self.connection.executemany(
+            """
+            INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (stage, word, correct_response) DO UPDATE SET
+                trials = trials + excluded.trials,
+                correct = correct + excluded.correct,
+                responded = responded + excluded.responded,
+                rt_sum = rt_sum + excluded.rt_sum,
+                rt_square_sum = rt_square_sum + excluded.rt_square_sum
+            """,
+            ((stage,) + delta for delta in deltas),
+        )
+
+    def items_below(self, stage, threshold, min_trials=1, correct_response=None):
+        """正確率低於 threshold（0~1）的項目，依正確率由低到高排序
+
+        回傳 dict 清單：word、correct_response、trials、accuracy、rt_mean。
+        """
+        query = (
+            "SELECT word, correct_response, trials, correct * 1.0 / trials,"
+            " CASE WHEN responded THEN rt_sum * 1.0 / responded END"
+            " FROM items WHERE stage = ? AND trials >= ? AND correct < ? * trials"
+        )
+        params = [stage, min_trials, threshold]
+        if correct_response is not None:
+            query += " AND correct_response = ?"
+            params.append(correct_response)
+        query += " ORDER BY 4, word"
+        return [
+            dict(
+                word=word,
+                correct_response=key,
+                trials=trials,
+                accuracy=accuracy,
+                rt_mean=rt_mean,
+            )
+            for word, key, trials, accuracy, rt_mean in self.connection.execute(
+                query, params
+            )
+        ]
+
+    def item_stats(self, word, stage=None):
+        """單一詞彙在各階段的彙整：trials、accuracy、rt_mean、rt_sd"""
+        query = "SELECT * FROM items WHERE word = ?"
+        params = [word]
+        if stage is not None:
+            query += " AND stage = ?"
+            params.append(stage)
+        stats = []
+        for (
+            item_stage,
+            _,
+            key,
+            trials,
+            correct,
+            responded,
+            rt_sum,
+            rt_square_sum,
+        ) in self.connection.execute(query, params):
+            rt_mean = rt_sum / responded if responded else None
+            rt_sd = (
+                ((rt_square_sum - responded * rt_mean**2) / (responded - 1)) ** 0.5
+                if responded > 1
+                else None
+            )
+            stats.append(
+                dict(
+                    stage=item_stage,
+                    correct_response=key,
+                    trials=trials,
+                    accuracy=correct / trials,
+                    rt_mean=rt_mean,
+                    rt_sd=rt_sd,
+                )
+            )
+        return stats
+
+    def rt_distribution(self, word, stage=None, correct_only=False):
+        """單一詞彙所有有按鍵試次的反應時間（由小到大）"""
+        query = "SELECT reaction_time FROM trials WHERE word = ?"
+        params = [word]
+        if stage is not None:
+            query += " AND stage = ?"
+            params.append(stage)
+        query += " AND reaction_time IS NOT NULL"
+        if correct_only:
+            query += " AND correct = 1"
+        query += " ORDER BY reaction_time"
+        return [rt for (rt,) in self.connection.execute(query, params)]
+
+
+def update_item_index(db_path, rows, replace=True):
+    """開啟索引、加入一個階段的試次後關閉；可交給背景執行緒或程序執行"""
+    index = ItemIndex(db_path)
+    try:
+        index.add_rows(rows, replace)
+    finally:
+        index.close()
+
+
+def main(argv):
+    usage = (
+        "用法:\n"
+        "  python item_index.py build <索引.sqlite> <試次檔> [<試次檔> ...]\n"
+        "  python item_index.py below <索引.sqlite> <階段前綴> <正確率 0~1>\n"
+        "  python item_index.py rt <索引.sqlite> <詞彙> [階段前綴]"
+    )
+    if len(argv) < 4:
+        print(usage)
+        return 1
+
+    command, db_path = argv[1], argv[2]
+    if command == "build":
+        from analysis import load_trials
+
+        trials = load_trials(argv[3:])
+        trials["reaction_time"] = trials["reaction_time"].fillna(0)
+        update_item_index(db_path, trials.to_dict("records"))
+        print(f"已加入 {len(trials)} 個試次到 {db_path}")
+        return 0
+
+    index = ItemIndex(db_path)
+    try:
+        if command == "below" and len(argv) == 5:
+            for item in index.items_below(argv[3], float(argv[4])):
+                rt_mean = item["rt_mean"]
+                print(
+                    f"{item['word']}\t{item['correct_response']}\t{item['trials']}"
+                    f"\t{item['accuracy']:.1%}"
+                    f"\t{'' if rt_mean is None else round(rt_mean)}"
+                )
+            return 0
+        if command == "rt":
+            stage = argv[4] if len(argv) > 4 else None
+            print(index.item_stats(argv[3], stage))
+            print(index.rt_distribution(argv[3], stage))
+            return 0
+    finally:
+        index.close()
+
+    print(usage)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
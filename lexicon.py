@@ -0,0 +1,250 @@
+import csv
+import random
+import sqlite3
+import sys
+import zlib
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS words (
+    id INTEGER PRIMARY KEY,
+    word TEXT NOT NULL UNIQUE,
+    is_word INTEGER NOT NULL,      -- 1: 真詞, 0: 假詞
+    frequency REAL NOT NULL DEFAULT 0,
+    strokes INTEGER,
+    length INTEGER NOT NULL,
+    zhuyin TEXT,
+    freq_bin INTEGER NOT NULL,     -- 依詞頻分位數分層
+    bin_rank INTEGER NOT NULL      -- 層內序號，抽樣時直接以序號查詢
+);
+CREATE UNIQUE INDEX IF NOT EXISTS words_stratum
+    ON words (is_word, freq_bin, bin_rank);
+CREATE TABLE IF NOT EXISTS strata (
+    is_word INTEGER NOT NULL,
+    freq_bin INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (is_word, freq_bin)
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    group_name TEXT NOT NULL,
+    participant TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    is_word INTEGER NOT NULL,
+    word_id INTEGER NOT NULL REFERENCES words (id),
+    PRIMARY KEY (group_name, participant, stage, is_word, word_id)
+);
+"""
+
+LEXICON_FIELDS = ["word", "is_word", "frequency", "strokes", "length", "zhuyin"]
+
+
+def build_lexicon(db_path, rows, freq_bins=5):
+    """由詞彙列建立 SQLite 詞庫，並預先計算詞頻分層與層內序號
+
+    rows 為含有 LEXICON_FIELDS 欄位的 dict；length 缺少時以字數計算。
+    """
+    connection = sqlite3.connect(db_path)
+    try:
+        connection.executescript(SCHEMA)
+        connection.execute("DELETE FROM assignments")
+        connection.execute("DELETE FROM words")
+        connection.execute("DELETE FROM strata")
+        connection.execute(
+            "CREATE TEMP TABLE raw (word TEXT UNIQUE, is_word INTEGER,"
+            " frequency REAL, strokes INTEGER, length INTEGER, zhuyin TEXT)"
+        )
+        connection.executemany(
+            "INSERT OR IGNORE INTO raw VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    row["word"],
+                    int(row["is_word"]),
+                    float(row.get("frequency") or 0),
+                    int(row["strokes"]) if row.get("strokes") else None,
+                    int(row.get("length") or len(row["word"])),
+                    row.get("zhuyin") or None,
+                )
+                for row in rows
+            ),
+        )
+        connection.execute(
+            """
+            INSERT INTO words
+                (word, is_word, frequency, strokes, length, zhuyin, freq_bin, bin_rank)
+            SELECT word, is_word, frequency, strokes, length, zhuyin, freq_bin,
+                   ROW_NUMBER() OVER (PARTITION BY is_word, freq_bin ORDER BY word) - 1
+            FROM (
+                SELECT *,
+                       NTILE(?) OVER (PARTITION BY is_word ORDER BY frequency) - 1
+                           AS freq_bin
+                FROM raw
+            )
+            """,
+            (freq_bins,),
+        )
+        connection.execute(
+            "INSERT INTO strata SELECT is_word, freq_bin, COUNT(*)"
+            " FROM words GROUP BY is_word, freq_bin"
+        )
+        connection.execute("DROP TABLE raw")
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def build_lexicon_from_csv(csv_path, db_path, freq_bins=5):
+    """由 CSV（欄位見 LEXICON_FIELDS）建立詞庫，逐列串流讀取"""
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as file:
+        build_lexicon(db_path, csv.DictReader(file), freq_bins)
+
+
+class LexiconStore:
+    """SQLite 詞庫，依詞頻分層為每位參與者（組別 × 姓名）抽取不重複的詞彙"""
+
+    def __init__(self, db_path):
+        self.connection = sqlite3.connect(db_path)
+        self.upgrade_assignments()
+        # 各層大小很小，直接載入；詞彙本身只在抽樣時以索引查詢
+        self.strata = {}
+        for is_word, freq_bin, size in self.connection.execute(
+            "SELECT is_word, freq_bin, size FROM strata ORDER BY freq_bin"
+        ):
+            self.strata.setdefault(is_word, []).append((freq_bin, size))
+
+    def close(self):
+        self.connection.close()
+
+    def upgrade_assignments(self):
+        """舊版詞庫的 assignments 沒有組別，加上 group_name 欄位（舊紀錄的組別為空字串）"""
+        columns = [
+            row[1] for row in self.connection.execute("PRAGMA table_info(assignments)")
+        ]
+        if "group_name" in columns:
+            return
+        with self.connection:
+            self.connection.execute("ALTER TABLE assignments RENAME TO old_assignments")
+            self.connection.executescript(SCHEMA)
+            self.connection.execute(
+                "INSERT INTO assignments SELECT '', participant, stage, is_word, word_id"
+                " FROM old_assignments"
+            )
+            self.connection.execute("DROP TABLE old_assignments")
+
+    def participant_random(self, group, participant, stage):
+        """每位參與者、每個階段使用固定的亂數種子，重跑時抽到相同的詞"""
+        return random.Random(
+            zlib.crc32(f"{group}\0{participant}\0{stage}".encode("utf-8"))
+        )
+
+    def used_word_ids(self, group, participant, exclude_stage):
+        """該參與者在其他階段已分配的詞"""
+        return {
+            word_id
+            for (word_id,) in self.connection.execute(
+                "SELECT word_id FROM assignments"
+                " WHERE group_name = ? AND participant = ? AND stage != ?",
+                (group, participant, exclude_stage),
+            )
+        }
+
+    def word_ids(self, words):
+        """詞庫中這些詞的 id（不在詞庫中的詞略過）"""
+        words = list(words)
+        ids = set()
+        for start in range(0, len(words), 500):
+            chunk = words[start : start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            ids.update(
+                word_id
+                for (word_id,) in self.connection.execute(
+                    f"SELECT id FROM words WHERE word IN ({placeholders})", chunk
+                )
+            )
+        return ids
+
+    def sample_words(self, group, participant, stage, is_word, count, exclude=()):
+        """為參與者的某個階段抽取 count 個真詞或假詞
+
+        詞數平均分配到各詞頻層，且不與該參與者其他階段的詞以及 exclude 中的詞
+        （words_config 列出的詞與 PM target）重疊。
+        同一參與者與階段重複呼叫時（例如重做練習）回傳相同的詞。
+        """
+        is_word = int(is_word)
+        if count <= 0:
+            return []
+        assigned = [
+            word
+            for (word,) in self.connection.execute(
+                "SELECT w.word FROM assignments a JOIN words w ON w.id = a.word_id"
+                " WHERE a.group_name = ? AND a.participant = ? AND a.stage = ?"
+                " AND a.is_word = ?",
+                (group, participant, stage, is_word),
+            )
+        ]
+        if assigned:
+            return assigned
+
+        strata = self.strata.get(is_word, [])
+        if count > sum(size for _, size in strata):
+            raise ValueError(f"詞庫中的{'真詞' if is_word else '假詞'}不足 {count} 個")
+
+        rng = self.participant_random(group, participant, stage)
+        used = self.used_word_ids(group, participant, stage) | self.word_ids(exclude)
+
+        # 平均分配到各層，餘數隨機分給其中幾層
+        quotas = [count // len(strata)] * len(strata)
+        for index in rng.sample(range(len(strata)), count % len(strata)):
+            quotas[index] += 1
+
+        chosen = []
+        shortfall = 0
+        for (freq_bin, size), quota in zip(strata, quotas):
+            quota += shortfall
+            picked = self.sample_stratum(rng, is_word, freq_bin, size, quota, used)
+            shortfall = quota - len(picked)
+            chosen += picked
+        if shortfall:
+            raise ValueError(f"詞庫中可用的詞彙不足，無法為階段 {stage} 抽取 {count} 個詞")
+
+        self.connection.executemany(
+            "INSERT INTO assignments VALUES (?, ?, ?, ?, ?)",
+            ((group, participant, stage, is_word, word_id) for word_id, _ in chosen),
+        )
+        self.connection.commit()
+        return [word for _, word in chosen]
+
+    def sample_stratum(self, rng, is_word, freq_bin, size, quota, used):
+        """以隨機層內序號查詢，只讀取被抽中的列"""
+        picked = []
+        tried = set()
+        while len(picked) < quota and len(tried) < size:
+            want = min((quota - len(picked)) * 2, size - len(tried))
+            if len(tried) * 2 > size:
+                # 層內大多已試過時改為直接從剩餘序號抽
+                batch = rng.sample([r for r in range(size) if r not in tried], want)
+            else:
+                batch = []
+                while len(batch) < want:
+                    rank = rng.randrange(size)
+                    if rank not in tried:
+                        tried.add(rank)
+                        batch.append(rank)
+            tried.update(batch)
+            placeholders = ", ".join("?" * len(batch))
+            rows = self.connection.execute(
+                f"SELECT id, word FROM words WHERE is_word = ? AND freq_bin = ?"
+                f" AND bin_rank IN ({placeholders})",
+                [is_word, freq_bin] + batch,
+            ).fetchall()
+            rng.shuffle(rows)
+            for word_id, word in rows:
+                if word_id not in used and len(picked) < quota:
+                    used.add(word_id)
+                    picked.append((word_id, word))
+        return picked
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("用法: python lexicon.py <詞彙.csv> <詞庫.sqlite>")
+        sys.exit(1)
+    build_lexicon_from_csv(sys.argv[1], sys.argv[2])
@@ -1,4 +1,6 @@
+import argparse
 import datetime
+import gc
 import json
 import os
 import random
@@ -10,6 +12,152 @@ import openpyxl
 import pandas as pd
 from openpyxl.utils.dataframe import dataframe_to_rows
 
+from async_runner import AsyncTkRunner
+from exporters import create_trial_exporters
+from item_index import update_item_index
+from lexicon import LexiconStore
+from marathon import LazyTimeline, save_stage_summaries_workbook
+from realtime import (
+    choose_cpus,
+    create_background_executor,
+    enable_realtime,
+    write_session_metadata,
+)
+from telemetry import ResourceTelemetry
+from session import (
+    BLANK_MS,
+    FALSE_WORD,
+    PM_TARGET,
+    TRUE_WORD,
+    TrialDescriptor,
+    TrialRecord,
+    compile_stage,
+    get_stage_spec,
+    validate_types,
+)
+from zhuyin import ZhuyinIndex, audit_stage_words
+
+
+def write_trial_rows(exporters, rows):
+    """將試次寫入每個匯出器"""
+    for exporter in exporters:
+        exporter.write_rows(rows)
+
+
+def close_trial_exporters(exporters):
+    for exporter in exporters:
+        exporter.close()
+
+
+def save_results_workbook(session_data, group, participant_name):
+    """保存結果到Excel文件（不依賴視窗，可在背景程序執行）"""
+    filename = f"{group}.xlsx"
+    if not os.path.exists(filename):
+        workbook = openpyxl.Workbook()
+        # 如果是新文件，先移除默認創建的工作表
+        workbook.remove(workbook.active)
+    else:
+        # 文件存在，則打開該文件
+        workbook = openpyxl.load_workbook(filename)
+
+    # 如果已有以 participant_name 命名的工作表，刪除該工作表以覆蓋
+    if participant_name in workbook.sheetnames:
+        del workbook[participant_name]
+
+    # 創建一個新的工作表
+    worksheet = workbook.create_sheet(title=participant_name)
+
+    # 處理每個階段的數據
+    for stage in ["prac", "nofb", "rfb", "pfb", "rpfb"]:
+        print("===============")
+        print(f"stage:{stage}")
+        # 根據階段名稱動態生成對應的欄位名稱
+        lexical_key = f"lexical_{stage}"
+        keyresponse_key = f"keyresponse_{stage}"
+        lexical_ans_key = f"lexical_ans_{stage}"
+        lexical_crate_key = f"lexical_crate_{stage}"
+        phonetic_ans_key = f"phonetic_ans_{stage}"
+        phonetic_crate_key = f"phonetic_crate_{stage}"
+        reactiontime_key = f"reactiontime_{stage}"
+        reactiontime_avg_key = f"reactiontime_avg_{stage}"
+        accum_key = f"accum_{stage}" if stage in ["rfb", "pfb", "rpfb"] else None
+
+        # 獲取對應欄位的數據
+        if session_data[lexical_key]:
+            max_len = max(
+                len(session_data[lexical_key]),
+                len(session_data[keyresponse_key]),
+                len(session_data[lexical_ans_key]),
+                len(session_data[lexical_crate_key]),
+                len(session_data[phonetic_ans_key]),
+                len(session_data[phonetic_crate_key]),
+                len(session_data[reactiontime_key]),
+                len(session_data[reactiontime_avg_key]),
+                len(session_data[accum_key])
+                if accum_key
+                else 0,  # 新增金錢變化的欄位長度
+            )
+
+            # 將所有列表填充到相同長度
+            time_list = [session_data["time"][0]] + [""] * (max_len - 1)
+            practice_list = [""] * max_len
+
+            session_data[lexical_key] += [""] * (
+                max_len - len(session_data[lexical_key])
+            )
+            session_data[keyresponse_key] += [""] * (
+                max_len - len(session_data[keyresponse_key])
+            )
+            session_data[lexical_ans_key] += [""] * (
+                max_len - len(session_data[lexical_ans_key])
+            )
+            session_data[lexical_crate_key] += [""] * (
+                max_len - len(session_data[lexical_crate_key])
+            )
+            session_data[phonetic_ans_key] += [""] * (
+                max_len - len(session_data[phonetic_ans_key])
+            )
+            session_data[phonetic_crate_key] += [""] * (
+                max_len - len(session_data[phonetic_crate_key])
+            )
+            session_data[reactiontime_key] += [""] * (
+                max_len - len(session_data[reactiontime_key])
+            )
+            session_data[reactiontime_avg_key] += [""] * (
+                max_len - len(session_data[reactiontime_avg_key])
+            )
+            if accum_key:  # 如果有累積金額的欄位，填充到相同長度
+                session_data[accum_key] += [""] * (
+                    max_len - len(session_data[accum_key])
+                )
+            # 構建 summary_data 字典
+            summary_data = {
+                "time": time_list,
+                f"{stage}": practice_list,
+                lexical_key: session_data[lexical_key],
+                keyresponse_key: session_data[keyresponse_key],
+                lexical_ans_key: session_data[lexical_ans_key],
+                lexical_crate_key: session_data[lexical_crate_key],
+                phonetic_ans_key: session_data[phonetic_ans_key],
+                phonetic_crate_key: session_data[phonetic_crate_key],
+                reactiontime_key: session_data[reactiontime_key],
+                reactiontime_avg_key: session_data[reactiontime_avg_key],
+            }
+            print(f"summary_data")
+            print(summary_data)
+            # 新增金錢變化的欄位
+            print("accum_key")
+            print(accum_key)
+            if accum_key:
+                summary_data[accum_key] = session_data[accum_key]
+            summary_df = pd.DataFrame(summary_data)
+
+            for r in dataframe_to_rows(summary_df, index=False, header=True):
+                worksheet.append(r)
+
+        # 保存 Excel 文件
+        workbook.save(filename)
+
 
 class LanguageProcessingTestSystem:
     def __init__(
@@ -19,22 +167,101 @@ class LanguageProcessingTestSystem:
         font_family="Microsoft JhengHei",
         stage_order=["formal", "reward", "penalty", "reward_penalty"],
         config_path=r"C:\Users\USER\Desktop\LanguageProcessingTestSystem-main\LanguageProcessingTestSystem-main\words_config.json",
+        export_formats=["csv"],
+        gc_quiet=False,
+        lexicon_path=None,
+        zhuyin_cache_path=None,
+        upload_hook=None,
+        kiosk=False,
+        kiosk_return_ms=5000,
+        telemetry_interval=None,
+        item_index_path=None,
+        marathon=False,
+        spill_chunk=500,
+        stage_repeats=1,
+        words_config=None,
     ):
+        # root 為 None 時不建立畫面，只保留資料路徑（供效能測試與模擬工具使用）；
+        # words_config 為已載入的 types 區塊時不再讀取 config_path
         self.root = root
-        self.root.title("詞彙判斷試驗系統")
-        self.root.attributes("-fullscreen", True)  # 設置全屏顯示
-        self.root.bind("<Escape>", self.exit_fullscreen)  # 綁定 Escape 鍵退出全屏
+        if root is not None:
+            self.root.title("詞彙判斷試驗系統")
+            self.root.attributes("-fullscreen", True)  # 設置全屏顯示
+            self.root.bind("<Escape>", self.exit_fullscreen)  # 綁定 Escape 鍵退出全屏
 
-        self.participant_name = ""
-        self.group = ""
         self.accuracy_threshold = 0.8
-        self.stage_order = stage_order
+        # stage_repeats > 1 時整個 stage_order 重複施測（例如長時間的重複區塊設計）
+        self.stage_order = list(stage_order) * stage_repeats
         self.font = (font_family, font_size)  # 使用指定字體
-
-        self.words_config = self.load_words_from_config(config_path)["types"]
+        self.export_formats = export_formats  # 逐試次匯出格式: csv / parquet / arrow
+        self.trial_exporters = []
+        # GC 安靜模式：刺激呈現時停用自動回收，改在黑屏期間手動回收
+        self.gc_quiet = gc_quiet
+
+        # 連續施測模式：結束後回到輸入畫面，設定、字型、元件與可共用的結果檔保持載入
+        self.kiosk = kiosk
+        self.kiosk_return_ms = kiosk_return_ms
+        self.open_exporters = {}  # 路徑 → 可跨參與者共用的匯出器
+
+        # 資源取樣：None 為關閉，0 只在階段邊界取樣，N 另外每 N 個試次取樣一次
+        self.telemetry_interval = telemetry_interval
+
+        # 詞彙層級索引（SQLite），每個階段存檔時一併更新
+        self.item_index_path = item_index_path
+
+        # 馬拉松模式：試次每累積 spill_chunk 筆就寫入試次匯出檔，記憶體中只保留
+        # 各階段的彙整，階段結束的存檔工作不隨施測長度增加
+        self.marathon = marathon
+        self.spill_chunk = spill_chunk
+        if marathon and not export_formats:
+            raise ValueError("馬拉松模式需要至少一種試次匯出格式（export_formats）")
+
+        # 由 AsyncTkRunner 驅動時，存檔與上傳在背景執行，不阻塞畫面
+        self.async_runner = None
+        # 背景存檔或上傳的錯誤；施測中不打斷，等到指導語或結束畫面再通知施測者
+        self.background_errors = []
+        self.session_active = False
+        # 即時模式實際取得的設定（由 __main__ 設定）；此時匯出檔只在背景程序中開啟
+        self.realtime = None
+        # 選用的上傳協程: await upload_hook(participant, group, stage_prefix, rows)
+        self.upload_hook = upload_hook
+
+        if words_config is None:
+            words_config = self.load_words_from_config(config_path)["types"]
+        self.words_config = words_config
         if not self.words_config:
             raise ValueError("Failed to load words configuration")
 
+        # 大型詞庫（SQLite），階段配置中有 "lexicon" 時由此抽詞
+        self.lexicon = LexiconStore(lexicon_path) if lexicon_path else None
+
+        # 注音索引快取（由 zhuyin.py build 產生），用來檢查各階段詞彙是否含有 PM 符號
+        self.zhuyin_index = (
+            ZhuyinIndex.load(zhuyin_cache_path) if zhuyin_cache_path else None
+        )
+
+        # 每位參與者的狀態
+        self.reset_session_state()
+
+        # # 單詞清單，按指定順序排好
+        # self.word_list = self.create_word_list()
+
+        # GUI設置
+        if root is not None:
+            self.setup_gui()
+
+    def reset_session_state(self):
+        """初始化（或在連續施測時重置）每位參與者的狀態"""
+        # 上一位參與者開始時凍結的物件解除凍結，讓它們的垃圾可以被回收
+        gc.unfreeze()
+        self.participant_name = ""
+        self.group = ""
+        self.session_id = ""  # 開始施測的時間，區分同名參與者的不同施測
+        self.gc_pause_ms = ""  # 最近一次黑屏期間手動回收所花的時間
+        self.telemetry = None
+        self.trial_counter = 0  # 本次施測已呈現的試次數
+        self.block_index = 0  # 本次施測已開始的區塊數（重做的練習與重複的階段各算一次）
+
         self.correct_answers = 0
         self.current_question_count = 0  # 當前已回答的問題數
         self.timeout_id = None
@@ -57,6 +284,12 @@ class LanguageProcessingTestSystem:
         # 變量來跟踪當前的階段
         self.current_stage = ""
 
+        # 編譯後的實驗時間軸（練習 + stage_order），在 start_experiment 時產生
+        self.timeline = ()
+        self.current_block = None
+        self.current_event = None
+        self.event_index = 0
+
         self.summary_data = {
             "time": [datetime.datetime.now().strftime("%Y-%m-%d_%Hh%M")],
             "practice": [],
@@ -90,22 +323,14 @@ class LanguageProcessingTestSystem:
             "reward_penalty": [],
         }
 
-        # # 單詞清單，按指定順序排好
-        # self.word_list = self.create_word_list()
-
-        # GUI設置
-        self.setup_gui()
+        # 馬拉松模式：尚未寫出的試次列、已完成階段的彙整、本階段的反應時間總和
+        self.spool = []
+        self.stage_summaries = []
+        self.stage_runs = {}  # 階段前綴 → 已完成的次數
+        self.stage_rt_sum = 0
 
     def load_words_from_config(self, config_path):
         """根據JSON配置檔載入所有階段的詞彙"""
-        required_stages = [
-            "practice",
-            "formal",
-            "reward",
-            "penalty",
-            "reward_penalty",
-        ]  # 必須包含的五個階段
-
         if not os.path.exists(config_path):
             messagebox.showerror("錯誤", f"Config file {config_path} 不存在。")
             return None
@@ -114,18 +339,13 @@ class LanguageProcessingTestSystem:
             with open(config_path, "r", encoding="utf-8") as file:
                 config_data = json.load(file)  # 載入JSON檔案
 
-            missing_stages = [
-                stage for stage in required_stages if stage not in config_data["types"]
-            ]
-
-            if missing_stages:
-                missing_stages_str = ", ".join(missing_stages)
-                messagebox.showerror(
-                    "錯誤", f"缺少以下階段的詞彙配置: {missing_stages_str}"
-                )
+            # 必須包含五個階段，且各階段的詞彙類型與 PM 位置正確
+            errors = validate_types(config_data["types"])
+            if errors:
+                messagebox.showerror("錯誤", "\n".join(errors))
                 return None
 
-            return config_data  # 如果所有必須的階段都存在，回傳完整的配置
+            return config_data  # 檢查通過，回傳完整的配置
 
         except json.JSONDecodeError:
             messagebox.showerror("錯誤", "JSON 文件格式錯誤，無法解析。")
@@ -141,7 +361,8 @@ class LanguageProcessingTestSystem:
             # 取得對應階段的詞彙區塊
             stage_words = self.words_config[stage]
 
-            word_types = list(stage_words.keys())
+            # "lexicon" 為抽樣設定，不是詞彙類型
+            word_types = [key for key in stage_words.keys() if key != "lexicon"]
 
             # 使用鍵名動態分配對應的詞彙
             self.true_word_type = word_types[0]  # 動態取得真詞類型
@@ -153,19 +374,62 @@ class LanguageProcessingTestSystem:
             self.false_words = set(stage_words[self.false_word_type])
             self.pm_targets = stage_words[self.pm_target_type]
 
+            # 由詞庫為當前參與者分層抽取真詞與假詞，與其他階段不重疊
+            sample_counts = stage_words.get("lexicon")
+            if sample_counts:
+                if self.lexicon is None:
+                    raise ValueError(f"階段 {stage} 需要詞庫，但未指定 lexicon_path")
+                # 不抽到 words_config 中任何階段已列出的詞或 PM target
+                configured = self.configured_words()
+                self.true_words |= set(
+                    self.lexicon.sample_words(
+                        self.group,
+                        self.participant_name,
+                        stage,
+                        True,
+                        sample_counts.get(self.true_word_type, 0),
+                        configured,
+                    )
+                )
+                self.false_words |= set(
+                    self.lexicon.sample_words(
+                        self.group,
+                        self.participant_name,
+                        stage,
+                        False,
+                        sample_counts.get(self.false_word_type, 0),
+                        configured,
+                    )
+                )
+
             print(f"Loaded words for stage: {stage}")
         except KeyError as e:
             print(f"Error: Stage '{stage}' not found in words_config - {e}")
             raise ValueError(f"Missing words configuration for stage: {stage}")
 
+    def configured_words(self):
+        """words_config 各階段列出的所有詞與 PM target"""
+        return {
+            word
+            for stage_words in self.words_config.values()
+            for key, words in stage_words.items()
+            if key != "lexicon"
+            for word in words
+        }
+
     def create_word_list(self):
         total_words = (
             len(self.true_words) + len(self.false_words) + len(self.pm_targets)
         )
         word_list = [None] * total_words  # 初始化詞彙列表
 
+        # 詞彙編號：真詞、假詞、PM target 依序編號
+        true_words = sorted(self.true_words)
+        false_words = sorted(self.false_words)
+        pm_offset = len(true_words) + len(false_words)
+
         # 將 PM target 移到指定的位置，並檢查是否超出範圍
-        for target, pos in self.pm_targets.items():
+        for pm_index, (target, pos) in enumerate(self.pm_targets.items()):
             if pos - 1 >= total_words or pos - 1 < 0:
                 messagebox.showerror(
                     "錯誤",
@@ -173,22 +437,75 @@ class LanguageProcessingTestSystem:
                 )
                 self.root.destroy()  # 結束程序
                 return  # 確保程式中斷
-            word_list[pos - 1] = (target, self.pm_target_type)
+            word_list[pos - 1] = TrialDescriptor(
+                pm_offset + pm_index, target, PM_TARGET, self.pm_target_type
+            )
 
         # 將其餘的詞隨機填入空位
-        remaining_words = [(word, self.true_word_type) for word in self.true_words] + [
-            (word, self.false_word_type) for word in self.false_words
+        remaining_words = [
+            TrialDescriptor(word_id, word, TRUE_WORD, self.true_word_type)
+            for word_id, word in enumerate(true_words)
+        ] + [
+            TrialDescriptor(len(true_words) + i, word, FALSE_WORD, self.false_word_type)
+            for i, word in enumerate(false_words)
         ]
 
         random.shuffle(remaining_words)
 
         # 將未指定順序的詞彙填充到空位
+        remaining_words = iter(remaining_words)
         for i in range(len(word_list)):
-            if word_list[i] is None and remaining_words:
-                word_list[i] = remaining_words.pop(0)
+            if word_list[i] is None:
+                word_list[i] = next(remaining_words, None)
 
         return word_list
 
+    def compile_stage_block(self, stage):
+        """選詞、排序並將單一階段編譯成事件序列"""
+        self.select_words_for_stage(stage)
+        if self.zhuyin_index is not None:
+            issues = audit_stage_words(
+                self.zhuyin_index,
+                stage,
+                self.true_words,
+                self.false_words,
+                self.pm_targets,
+            )
+            for issue, words in issues.items():
+                print(f"Warning: stage {stage} {issue}: {words}")
+        word_list = self.create_word_list()
+        if word_list is None:
+            return None
+        return compile_stage(
+            stage,
+            word_list,
+            self.true_word_type,
+            self.false_word_type,
+            self.pm_target_type,
+        )
+
+    def compile_session(self):
+        """在第一個試次之前，將練習與 stage_order 全部編譯成不可變的時間軸"""
+        if self.marathon:
+            # 每種階段先編譯一次檢查設定；重複的階段在顯示指導語時才重新編譯
+            stages = ["practice"] + list(self.stage_order)
+            blocks = {}
+            for stage in dict.fromkeys(stages):
+                blocks[stage] = self.compile_stage_block(stage)
+                if blocks[stage] is None:
+                    return False
+            self.timeline = LazyTimeline(stages, self.compile_stage_block)
+            self.timeline.replace(0, blocks["practice"])
+            return True
+        blocks = []
+        for stage in ["practice"] + list(self.stage_order):
+            block = self.compile_stage_block(stage)
+            if block is None:
+                return False
+            blocks.append(block)
+        self.timeline = tuple(blocks)
+        return True
+
     def exit_fullscreen(self, event=None):
         """退出全屏"""
         self.root.attributes("-fullscreen", False)
@@ -240,6 +557,40 @@ class LanguageProcessingTestSystem:
         )
         self.balance_label.pack(anchor="nw", padx=10, pady=10)
 
+        # 連續施測時重複使用的輸入畫面元件（依顯示順序）
+        self.setup_widgets = [
+            self.instructions_label,
+            self.name_label,
+            self.name_entry,
+            self.group_label,
+            self.group_entry,
+            self.start_button,
+        ]
+
+    def show_setup_screen(self):
+        """回到姓名與組別的輸入畫面，重複使用已建立的元件"""
+        self.root.unbind("<Key>")
+        self.root.unbind("<Return>")
+        for widget in self.root.winfo_children():
+            widget.pack_forget()
+            # 上一位參與者留下的 Label 直接銷毀，避免元件累積
+            if widget not in self.setup_widgets and widget is not self.balance_label:
+                widget.destroy()
+
+        self.instructions_label = self.setup_widgets[0]
+        self.name_entry.delete(0, tk.END)
+        self.group_entry.delete(0, tk.END)
+        for widget in self.setup_widgets:
+            widget.pack()
+        self.clear_balance_label()
+        self.balance_label.pack(anchor="nw", padx=10, pady=10)
+        self.name_entry.focus_set()
+
+    def start_next_session(self):
+        """連續施測：重置狀態並回到輸入畫面"""
+        self.reset_session_state()
+        self.show_setup_screen()
+
     def update_balance_label(self):
         """更新金額顯示"""
         self.balance_label.config(text=f"金額: {self.current_balance} 元")
@@ -253,6 +604,51 @@ class LanguageProcessingTestSystem:
         if not self.participant_name or not self.group:
             messagebox.showerror("錯誤", "請輸入姓名和組別。")
             return
+        self.session_id = datetime.datetime.now().isoformat(timespec="milliseconds")
+
+        try:
+            if not self.compile_session():
+                return
+        except ValueError as e:
+            messagebox.showerror("錯誤", str(e))
+            return
+
+        try:
+            self.trial_exporters = create_trial_exporters(
+                self.group,
+                self.participant_name,
+                self.export_formats,
+                open_exporters=self.open_exporters if self.kiosk else None,
+                deferred=self.realtime is not None,
+            )
+        except Exception as e:
+            messagebox.showerror("錯誤", f"建立試次匯出檔案時發生錯誤: {e}")
+            return
+
+        if self.realtime is not None:
+            self.run_io(
+                write_session_metadata,
+                f"{self.group}_{self.participant_name}_session.json",
+                {
+                    "participant": self.participant_name,
+                    "group": self.group,
+                    "started": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "realtime": self.realtime,
+                },
+            )
+
+        if self.telemetry_interval is not None:
+            self.telemetry = ResourceTelemetry(
+                f"{self.group}_{self.participant_name}_telemetry.jsonl",
+                self.telemetry_interval,
+            )
+            self.sample_telemetry("session_start")
+
+        self.session_active = True
+        if self.gc_quiet:
+            # 設置完成後凍結現有物件，之後的回收只需處理試次期間產生的物件
+            gc.collect()
+            gc.freeze()
 
         self.run_practice_instructions()
 
@@ -263,9 +659,10 @@ class LanguageProcessingTestSystem:
         for widget in self.root.winfo_children():
             widget.pack_forget()
 
+        practice_block = self.timeline[0]
         self.title_label = tk.Label(
             self.root,
-            text="練習階段",
+            text=practice_block.title,
             font=(self.font[0], self.font[1] + 30),  # 字體加大
             fg="white",
             bg="black",
@@ -275,8 +672,7 @@ class LanguageProcessingTestSystem:
         # 顯示前導詞
         self.instructions_label = tk.Label(
             self.root,
-            text="真實的詞彙請按「A」，非真實的詞彙請按「L」，\n"
-            "但當詞彙中的注音包含「ㄍ」或「ㄐ」時，請按「空白鍵」。\n",
+            text=practice_block.instructions,
             font=self.font,
             fg="white",
             bg="black",
@@ -346,19 +742,49 @@ class LanguageProcessingTestSystem:
         """開始練習"""
         self.root.unbind("<Key>")
         self.current_stage = "practice"
-        self.select_words_for_stage(self.current_stage)
+        self.current_block = self.timeline[0]
+        self.block_index += 1
+        self.sample_telemetry("stage_start")
         self.run_practice()
 
     def run_practice(self):
         """運行練習"""
-        self.word_list = self.create_word_list()  # 重置詞彙列表
+        self.event_index = 0  # 從頭走訪練習事件
         self.show_black_screen_before_next_word(stage="practice")
 
     def show_black_screen_before_next_word(self, stage):
         """顯示全黑屏幕500ms，然後顯示下一個單詞"""
         print(f"show_black_screen_before_next_word:{stage}")
         self.show_black_screen()
-        self.root.after(500, lambda: self.show_next_word(stage))
+        blank_start = time.perf_counter()  # 黑屏期間的工作計入黑屏時間
+        if self.gc_quiet:
+            self.collect_garbage_during_blank()
+        if self.marathon and len(self.spool) >= self.spill_chunk:
+            self.flush_spool()  # 上一個試次的金額已確定，在黑屏期間寫出
+        if (
+            self.telemetry is not None
+            and self.trial_counter
+            and self.telemetry.due(self.trial_counter)
+        ):
+            self.sample_telemetry("trial")
+        events = self.current_block.events
+        blank_ms = (
+            events[self.event_index].blank_ms
+            if self.event_index < len(events)
+            else BLANK_MS
+        )
+        elapsed_ms = (time.perf_counter() - blank_start) * 1000
+        if elapsed_ms > blank_ms:
+            print(f"Warning: 黑屏期間的工作花了 {elapsed_ms:.1f}ms，超過 {blank_ms}ms")
+        self.root.after(
+            max(0, round(blank_ms - elapsed_ms)), lambda: self.show_next_word(stage)
+        )
+
+    def collect_garbage_during_blank(self):
+        """在黑屏期間手動回收，並記錄暫停時間供下一個試次寫入"""
+        start = time.perf_counter()
+        gc.collect()
+        self.gc_pause_ms = round((time.perf_counter() - start) * 1000, 3)
 
     def show_black_screen(self):
         """顯示全黑屏幕"""
@@ -374,19 +800,28 @@ class LanguageProcessingTestSystem:
         for widget in self.root.winfo_children():
             widget.pack_forget()
 
-        if stage == "reward" or stage == "penalty" or stage == "reward_penalty":
+        if self.current_block.show_balance:
             self.update_balance_label()  # 更新金額顯示
 
-        if self.word_list:
-            self.current_word, self.current_key = self.word_list.pop(0)
+        if self.event_index < len(self.current_block.events):
+            event = self.current_block.events[self.event_index]
+            self.event_index += 1
+            self.trial_counter += 1
+            self.current_event = event
+            self.current_word = event.word
+            self.current_key = event.correct_key
+            if self.gc_quiet:
+                gc.disable()  # 刺激呈現期間不讓自動回收打斷反應時間
             self.start_time = time.time()  # 記錄開始顯示單詞的時間
             self.instructions_label.config(
                 text=self.current_word, font=self.font, fg="white", bg="black"
             )
             self.instructions_label.pack(expand=True)
             self.root.bind("<Key>", lambda event: self.check_answer(event, stage))
+            if self.async_runner is not None:
+                self.async_runner.hold()  # 作答期間暫停背景工作
             self.timeout_id = self.root.after(
-                3000, lambda: self.check_answer_timeout(stage)
+                event.stimulus_ms, lambda: self.check_answer_timeout(stage)
             )
         else:
             self.end_stage(stage)
@@ -408,6 +843,8 @@ class LanguageProcessingTestSystem:
 
         # 有效按鍵處理
         print(f"check_answer stage:{stage}")
+        if self.async_runner is not None:
+            self.async_runner.release()
         if self.timeout_id is not None:
             self.root.after_cancel(self.timeout_id)
             self.timeout_id = None
@@ -418,67 +855,72 @@ class LanguageProcessingTestSystem:
             (time.time() - self.start_time) * 1000
         )  # 將反應時間從秒轉為毫秒
 
+        event = self.current_event
+
         # 保存反應時間和按鍵響應到results_data中
-        self.results_data[stage].append(
-            {
-                "word": self.current_word,
-                "response": key,
-                "reaction_time": reaction_time,
-                "correct_response": self.true_word_type
-                if self.current_word in self.true_words
-                else (
-                    self.false_word_type
-                    if self.current_word in self.false_words
-                    else self.pm_target_type
-                ),
-            }
+        self.record_trial(
+            stage, TrialRecord(event, key, reaction_time, self.gc_pause_ms)
         )
 
-        if self.current_word in self.true_words:
+        if event.word_type == TRUE_WORD:
             self.true_word_count += 1
-            if key == self.true_word_type:
+            if key == event.correct_key:
                 self.true_word_correct += 1
             self.true_word_accuracy = self.true_word_correct / self.true_word_count
             print(f"self.true_word_count: {self.true_word_count}")
             print(f"self.true_word_correct: {self.true_word_correct}")
             print(f"True word accuracy: {self.true_word_accuracy:.2%}")
-        elif self.current_word in self.false_words:
+        elif event.word_type == FALSE_WORD:
             self.false_word_count += 1
-            if key == self.false_word_type:
+            if key == event.correct_key:
                 self.false_word_correct += 1
             self.false_word_accuracy = self.false_word_correct / self.false_word_count
             print(f"self.false_word_count: {self.false_word_count}")
             print(f"self.false_word_correct: {self.false_word_correct}")
             print(f"False word accuracy: {self.false_word_accuracy:.2%}")
-        elif self.current_word in self.pm_targets:
+        else:
             self.pm_target_count += 1
-            if key == self.pm_target_type:
+            if key == event.correct_key:
                 self.pm_target_correct += 1
-                if stage in ["reward", "reward_penalty"]:
+                if event.reward_on_hit:
                     self.reward_user()  # 在獎勵或獎懲階段獎勵用戶
                     return
             else:
-                if stage in ["penalty", "reward_penalty"]:
+                if event.penalty_on_miss:
                     self.penalize_user()  # 在懲罰或獎懲階段處罰用戶
                     return
             print(f"self.pm_target_count: {self.pm_target_count}")
             print(f"self.pm_target_correct: {self.pm_target_correct}")
             self.pm_target_accuracy = self.pm_target_correct / self.pm_target_count
             print(f"PM target accuracy: {self.pm_target_accuracy:.2%}")
-        stage_prefix = self.get_stage_prefix(stage)
-        if stage_prefix in ["rfb", "pfb", "rpfb"]:
+        if event.accum_key:
             # 將當前金額追加到相應的summary_data欄位
-            self.summary_data[f"accum_{stage_prefix}"].append(self.current_balance)
+            self.record_balance(event.accum_key)
 
         self.show_black_screen_before_next_word(stage)
 
+    def record_trial(self, stage, record):
+        """保存一個試次；馬拉松模式只累計反應時間並將匯出列放入待寫出的緩衝"""
+        if not self.marathon:
+            self.results_data[stage].append(record)
+            return
+        self.stage_rt_sum += record.reaction_time
+        self.spool.append(self.trial_row(self.current_block.stage_prefix, record, ""))
+
+    def record_balance(self, accum_key):
+        """記錄當前試次結束時的金額；馬拉松模式直接寫進該試次的匯出列"""
+        if self.marathon:
+            self.spool[-1]["balance"] = self.current_balance
+        else:
+            self.summary_data[accum_key].append(self.current_balance)
+
     def reward_user(self):
         """獎勵用戶"""
         self.current_balance += 10
-        stage_prefix = self.get_stage_prefix(self.current_stage)  # 獲取當前階段的前綴
+        accum_key = self.current_event.accum_key
 
-        if stage_prefix in ["rfb", "rpfb"]:  # 在獎勵或獎懲階段更新金額
-            self.summary_data[f"accum_{stage_prefix}"].append(self.current_balance)
+        if accum_key:  # 在獎勵或獎懲階段更新金額
+            self.record_balance(accum_key)
 
         # 呼叫顯示獎勵信息函數，傳入正確的當前階段
         self.show_reward_message(stage=self.current_stage)
@@ -497,7 +939,7 @@ class LanguageProcessingTestSystem:
         self.instructions_label.pack(expand=True)
         self.root.update()
         self.root.after(
-            1500,
+            self.current_event.feedback_ms,
             lambda: self.update_balance_and_continue(
                 stage=stage
             ),  # 使用傳遞的 stage 參數
@@ -507,13 +949,12 @@ class LanguageProcessingTestSystem:
         """懲罰用戶"""
         print(f'"""懲罰用戶"""')
         self.current_balance -= 10
-        stage_prefix = self.get_stage_prefix(self.current_stage)  # 獲取當前階段的前綴
-        print(f"stage_prefix:{stage_prefix}")
+        accum_key = self.current_event.accum_key
+        print(f"accum_key:{accum_key}")
 
-        if stage_prefix in ["pfb", "rpfb"]:  # 在懲罰或獎懲階段更新金額
+        if accum_key:  # 在懲罰或獎懲階段更新金額
             print("# 在懲罰或獎懲階段更新金額")
-            self.summary_data[f"accum_{stage_prefix}"].append(self.current_balance)
-            print(self.summary_data[f"accum_{stage_prefix}"])
+            self.record_balance(accum_key)
 
         # 呼叫顯示懲罰信息函數，傳入正確的當前階段
         self.show_penalty_message(stage=self.current_stage)
@@ -532,7 +973,7 @@ class LanguageProcessingTestSystem:
         self.instructions_label.pack(expand=True)
         self.root.update()
         self.root.after(
-            1500,
+            self.current_event.feedback_ms,
             lambda: self.update_balance_and_continue(
                 stage=stage
             ),  # 使用傳遞的 stage 參數
@@ -546,43 +987,35 @@ class LanguageProcessingTestSystem:
     def check_answer_timeout(self, stage):
         """超時檢查答案"""
         print(f"check_answer_timeout:{stage}")
+        if self.async_runner is not None:
+            self.async_runner.release()
         if self.timeout_id is not None:
             self.timeout_id = None
             self.root.unbind("<Key>")
-        reaction_time = 3000  # 固定為3000毫秒
+        event = self.current_event
+        reaction_time = event.stimulus_ms  # 超時反應時間為刺激呈現時間
         key = ""  # 沒有按鍵響應
 
         # 保存超時反應到results_data中
-        self.results_data[stage].append(
-            {
-                "word": self.current_word,
-                "response": key,
-                "reaction_time": reaction_time,
-                "correct_response": self.true_word_type
-                if self.current_word in self.true_words
-                else (
-                    self.false_word_type
-                    if self.current_word in self.false_words
-                    else self.pm_target_type
-                ),
-            }
+        self.record_trial(
+            stage, TrialRecord(event, key, reaction_time, self.gc_pause_ms)
         )
 
-        if self.current_word in self.true_words:
+        if event.word_type == TRUE_WORD:
             self.true_word_count += 1
             self.true_word_accuracy = self.true_word_correct / self.true_word_count
             print(f"self.true_word_count: {self.true_word_count}")
             print(f"self.true_word_correct: {self.true_word_correct}")
             print(f"True word accuracy: {self.true_word_accuracy:.2%}")
-        elif self.current_word in self.false_words:
+        elif event.word_type == FALSE_WORD:
             self.false_word_count += 1
             self.false_word_accuracy = self.false_word_correct / self.false_word_count
             print(f"self.false_word_count: {self.false_word_count}")
             print(f"self.false_word_correct: {self.false_word_correct}")
             print(f"False word accuracy: {self.false_word_accuracy:.2%}")
-        elif self.current_word in self.pm_targets:
+        else:
             self.pm_target_count += 1
-            if stage == "penalty" or stage == "reward_penalty":
+            if event.penalty_on_miss:
                 print(f"在懲罰或獎懲階段才執行扣錢邏輯")
                 self.penalize_user()
                 return
@@ -593,15 +1026,17 @@ class LanguageProcessingTestSystem:
         print(f"PM target accuracy: {self.pm_target_accuracy:.2%}")
 
         # 在超時檢查答案後，即使沒有金額變動，也更新金額到 summary_data
-        stage_prefix = self.get_stage_prefix(stage)
-        if stage_prefix in ["rfb", "pfb", "rpfb"]:
+        if event.accum_key:
             # 將當前金額追加到相應的summary_data欄位
-            self.summary_data[f"accum_{stage_prefix}"].append(self.current_balance)
+            self.record_balance(event.accum_key)
 
         self.show_black_screen_before_next_word(stage)
 
     def end_stage(self, stage):
         """結束階段"""
+        if self.gc_quiet:
+            gc.enable()  # 階段之間恢復自動回收
+        self.sample_telemetry("stage_end")
         if stage == "practice":
             self.current_stage = "practice"
             self.end_practice()
@@ -641,6 +1076,14 @@ class LanguageProcessingTestSystem:
             or false_word_accuracy < self.accuracy_threshold
         ):
             self.reset_counters()
+            # 重新編譯練習階段，讓重做的練習重新洗牌
+            practice_block = self.compile_stage_block("practice")
+            if practice_block is None:
+                return
+            if self.marathon:
+                self.timeline.replace(0, practice_block)
+            else:
+                self.timeline = (practice_block,) + self.timeline[1:]
             self.run_practice_instructions()
         else:
             self.start_next_stage()
@@ -653,62 +1096,36 @@ class LanguageProcessingTestSystem:
     def run_main_experiment(self):
         """運行主要實驗"""
         if self.current_stage_index < len(self.stage_order):
-            stage = self.stage_order[self.current_stage_index]
             self.current_stage_index += 1
-            if stage == "formal":
-                print("formal")
-                self.current_stage = "formal"
-                self.show_instructions(
-                    "formal",
-                    "真實的詞彙請按「A」，非真實的詞彙請按「L」\n"
-                    "但當詞彙中的注音含有「ㄅ」或「ㄉ」時，請按「空白鍵」。\n",
-                )
-            elif stage == "reward":
-                print("reward")
-                self.current_stage = "reward"
-                self.show_instructions(
-                    "reward",
-                    "真實的詞彙請按「A」，非真實的詞彙請按「L」\n"
-                    "但當詞彙中的注音含有「ㄆ」或「ㄊ」時，請按「空白鍵」。\n"
-                    "\n"
-                    "每當您正確辨認出含有「ㄆ」與「ㄊ」的詞彙時，\n"
-                    "會顯示您獲得10元，且會累計顯示於左上角，\n"
-                    "若您了解此實驗的程序請按enter鍵開始。",
-                )
-            elif stage == "penalty":
-                print("penalty")
-                self.current_stage = "penalty"
-                self.show_instructions(
-                    "penalty",
-                    "請判斷螢幕上的詞彙是否為真實存在的詞彙，\n"
-                    "真實的詞彙請按「A」，非真實的詞彙請按「L」\n"
-                    "但當詞彙中的注音含有「ㄇ」或「ㄋ」時，請按「空白鍵」。\n"
-                    "\n"
-                    "每當您未正確辨認出含有「ㄇ」與「ㄋ」的詞彙時，\n"
-                    "會顯示您被扣除10元，且會累計顯示於左上角，\n"
-                    "若您了解此實驗的程序請按enter鍵開始。",
+            block = self.timeline[self.current_stage_index]
+            print(block.stage)
+            self.current_stage = block.stage
+            self.show_instructions(block.stage, block.instructions)
+        else:
+            # 傳入本次的資料，連續施測重置狀態後背景存檔仍使用原本的資料
+            if self.marathon:
+                self.run_io(
+                    save_stage_summaries_workbook,
+                    list(self.stage_summaries),
+                    self.group,
+                    self.participant_name,
                 )
-            elif stage == "reward_penalty":
-                print("reward_penalty")
-                self.current_stage = "reward_penalty"
-                self.show_instructions(
-                    "reward_penalty",
-                    "請判斷螢幕上的詞彙是否為真實存在的詞彙，\n"
-                    "真實的詞彙請按「A」，非真實的詞彙請按「L」\n"
-                    "但當詞彙中的注音含有「ㄈ」或「ㄌ」時，請按「空白鍵」。\n"
-                    "\n"
-                    "每當您正確辨認出含有「ㄈ」的詞彙時，\n"
-                    "會顯示您獲得10元，且會累計顯示於左上角，\n"
-                    "每當您未正確辨認出含有「ㄌ」的詞彙時，\n"
-                    "會顯示您被扣除10元，且會累計顯示於左上角，\n"
-                    "若您了解此實驗的程序請按enter鍵開始。",
+            else:
+                self.run_io(
+                    save_results_workbook,
+                    self.summary_data,
+                    self.group,
+                    self.participant_name,
                 )
-        else:
-            self.save_results()
+            self.close_trial_exporters()
+            self.close_telemetry()
+            self.session_active = False
             self.show_thank_you_message()
+            self.show_background_errors()
 
     def show_instructions(self, stage, instructions):
         """顯示每個階段的指導語"""
+        self.show_background_errors()
         self.instructions_label.config(
             text=instructions, font=self.font, fg="white", bg="black"
         )
@@ -733,9 +1150,11 @@ class LanguageProcessingTestSystem:
     def start_stage(self, event, stage):
         """開始階段"""
         print(f"stage{stage}")
-        self.select_words_for_stage(stage)
         self.root.unbind("<Key>")
-        self.word_list = self.create_word_list()  # 重置詞彙列表
+        self.current_block = self.timeline[self.current_stage_index]
+        self.block_index += 1
+        self.event_index = 0  # 從頭走訪該階段的事件
+        self.sample_telemetry("stage_start")
         if stage == "formal":
             self.run_formal_stage()
         elif stage == "reward":
@@ -748,7 +1167,6 @@ class LanguageProcessingTestSystem:
     def run_formal_stage(self):
         """運行正式測試階段"""
         self.reset_counters()
-        self.select_words_for_stage(self.current_stage)
         self.show_black_screen_before_next_word(stage="formal")
 
     def end_formal_stage(self):
@@ -760,8 +1178,7 @@ class LanguageProcessingTestSystem:
     def run_reward_stage(self):
         """運行獎勵階段"""
         self.reset_counters()
-        self.current_balance = 200  # 初始金額
-        self.select_words_for_stage(self.current_stage)
+        self.current_balance = self.current_block.initial_balance  # 初始金額
         self.update_balance_label()  # 顯示金額
         self.show_black_screen_before_next_word(stage="reward")
 
@@ -776,8 +1193,7 @@ class LanguageProcessingTestSystem:
         """運行懲罰階段"""
         print("run_penalty_stage")
         self.reset_counters()
-        self.current_balance = 200  # 初始金額
-        self.select_words_for_stage(self.current_stage)
+        self.current_balance = self.current_block.initial_balance  # 初始金額
         self.update_balance_label()  # 顯示金額
         self.show_black_screen_before_next_word(stage="penalty")
 
@@ -793,8 +1209,7 @@ class LanguageProcessingTestSystem:
     def run_reward_penalty_stage(self):
         """運行獎懲階段"""
         self.reset_counters()
-        self.current_balance = 200  # 初始金額
-        self.select_words_for_stage(self.current_stage)
+        self.current_balance = self.current_block.initial_balance  # 初始金額
         self.update_balance_label()  # 顯示金額
         self.show_black_screen_before_next_word(stage="reward_penalty")
 
@@ -823,29 +1238,32 @@ class LanguageProcessingTestSystem:
     def save_stage_results(self):
         """保存當前階段的結果到 summary_data"""
         print(f"Saving results for stage: {self.current_stage}")
-        stage_prefix = self.get_stage_prefix(self.current_stage)
+        if self.marathon:
+            self.save_stage_aggregates()
+            return
+        stage_prefix = self.current_block.stage_prefix
 
         # 取得當前階段的單詞列表
         current_results = self.results_data[self.current_stage]
 
         # 將每一個詞語結果保存到對應的 summary_data 欄位中
         for result in current_results:
-            self.summary_data[f"lexical_{stage_prefix}"].append(result["word"])
-            self.summary_data[f"keyresponse_{stage_prefix}"].append(result["response"])
+            self.summary_data[f"lexical_{stage_prefix}"].append(result.word)
+            self.summary_data[f"keyresponse_{stage_prefix}"].append(result.response)
 
-            if result["correct_response"] == self.pm_target_type:
+            if result.correct_response == self.current_block.pm_target_type:
                 self.summary_data[f"phonetic_ans_{stage_prefix}"].append(
-                    result["correct_response"]
+                    result.correct_response
                 )
                 self.summary_data[f"lexical_ans_{stage_prefix}"].append("")  # 對應空值
             else:
                 self.summary_data[f"lexical_ans_{stage_prefix}"].append(
-                    result["correct_response"]
+                    result.correct_response
                 )
                 self.summary_data[f"phonetic_ans_{stage_prefix}"].append("")  # 對應空值
 
             self.summary_data[f"reactiontime_{stage_prefix}"].append(
-                result["reaction_time"]
+                result.reaction_time
             )
 
         # 檢查是否是金錢變化階段，並記錄金額變化
@@ -856,6 +1274,9 @@ class LanguageProcessingTestSystem:
                 len(self.summary_data[f"lexical_{stage_prefix}"])
                 - len(self.summary_data[f"accum_{stage_prefix}"])
             )
+        # 逐試次匯出當前階段的結果
+        self.export_stage_trials(stage_prefix, current_results)
+
         # 計算當前階段的正確率並保存
         lexical_accuracy = self.calculate_lexical_accuracy()
         phonetic_accuracy = self.calculate_phonetic_accuracy()
@@ -868,7 +1289,7 @@ class LanguageProcessingTestSystem:
         )
 
         # 計算平均反應時間並保存
-        reaction_times = [result["reaction_time"] for result in current_results]
+        reaction_times = [result.reaction_time for result in current_results]
         average_reaction_time = (
             int(sum(reaction_times) / len(reaction_times)) if reaction_times else 0
         )
@@ -881,20 +1302,161 @@ class LanguageProcessingTestSystem:
         # 清空當前階段的結果
         self.results_data[self.current_stage] = []
 
+    def export_stage_trials(self, stage_prefix, current_results):
+        """將當前階段的試次逐列附加到匯出檔案"""
+        if not (self.trial_exporters or self.item_index_path) or not current_results:
+            return
+
+        # 金錢變化階段每個試次都會記錄一次金額，取最後幾筆即為本階段的金額軌跡
+        balances = [""] * len(current_results)
+        if stage_prefix in ["rfb", "pfb", "rpfb"]:
+            accum = [
+                value
+                for value in self.summary_data[f"accum_{stage_prefix}"]
+                if value != ""
+            ]
+            if len(accum) >= len(current_results):
+                balances = accum[-len(current_results) :]
+
+        rows = [
+            self.trial_row(stage_prefix, result, balance)
+            for result, balance in zip(current_results, balances)
+        ]
+        self.persist_stage(stage_prefix, rows)
+
+    def trial_row(self, stage_prefix, result, balance):
+        """單一試次的匯出列（欄位見 exporters.TRIAL_FIELDS）"""
+        return {
+            "participant": self.participant_name,
+            "group": self.group,
+            "session": self.session_id,
+            "stage": stage_prefix,
+            "block": self.block_index,
+            "word": result.word,
+            "response": result.response,
+            "correct_response": result.correct_response,
+            "reaction_time": result.reaction_time,
+            "balance": balance,
+            "gc_pause_ms": result.gc_pause_ms,
+        }
+
+    def save_stage_aggregates(self):
+        """馬拉松模式：寫出剩餘的試次，只保存本階段一列彙整
+
+        正確率由計數器計算、平均反應時間由累計的總和計算，不需重新走訪本階段的試次。
+        """
+        stage_prefix = self.current_block.stage_prefix
+        self.flush_spool()
+        trials = self.true_word_count + self.false_word_count + self.pm_target_count
+        run = self.stage_runs.get(stage_prefix, 0) + 1
+        self.stage_runs[stage_prefix] = run
+        self.stage_summaries.append(
+            {
+                "stage": stage_prefix,
+                "repetition": run,
+                "trials": trials,
+                "lexical_crate": round(self.calculate_lexical_accuracy(), 2),
+                "phonetic_crate": round(self.calculate_phonetic_accuracy(), 2),
+                "reactiontime_avg": int(self.stage_rt_sum / trials) if trials else 0,
+                "final_balance": (
+                    self.current_balance
+                    if self.current_block.initial_balance is not None
+                    else ""
+                ),
+            }
+        )
+        print(f"save_stage_results: {self.stage_summaries[-1]}")
+        self.stage_rt_sum = 0
+
+    def flush_spool(self):
+        """將緩衝中的試次列寫入匯出檔，並清空緩衝"""
+        if self.spool:
+            self.persist_stage(self.current_block.stage_prefix, self.spool)
+            self.spool = []
+
+    def persist_stage(self, stage_prefix, rows):
+        """寫入並上傳一個階段的試次；有 asyncio 執行器時不阻塞畫面"""
+        if self.async_runner is None:
+            write_trial_rows(self.trial_exporters, rows)
+            if self.item_index_path:
+                update_item_index(self.item_index_path, rows, not self.marathon)
+            return
+        self.async_runner.submit(
+            self.persist_stage_async(
+                list(self.trial_exporters),
+                self.participant_name,
+                self.group,
+                stage_prefix,
+                rows,
+            )
+        )
+
+    async def persist_stage_async(
+        self, exporters, participant_name, group, stage_prefix, rows
+    ):
+        await self.async_runner.run_io(write_trial_rows, exporters, rows)
+        if self.item_index_path:
+            await self.async_runner.run_io(
+                update_item_index, self.item_index_path, rows, not self.marathon
+            )
+        if self.upload_hook is not None:
+            await self.upload_hook(participant_name, group, stage_prefix, rows)
+
+    def report_background_error(self, exception):
+        """AsyncTkRunner 的 on_error：記錄錯誤，不在施測中時立即通知施測者"""
+        self.background_errors.append(f"{type(exception).__name__}: {exception}")
+        if not self.session_active:
+            self.show_background_errors()
+
+    def show_background_errors(self):
+        """以對話框列出尚未通知的背景錯誤"""
+        if not self.background_errors:
+            return
+        message = "\n".join(self.background_errors)
+        if self.async_runner is not None and self.async_runner.error_log:
+            message += f"\n\n詳細內容見 {self.async_runner.error_log}"
+        self.background_errors = []
+        messagebox.showerror("背景存檔失敗", message)
+
+    def run_io(self, func, *args):
+        """執行阻塞的 I/O；有 asyncio 執行器時依序在背景執行"""
+        if self.async_runner is None:
+            func(*args)
+        else:
+            self.async_runner.submit(self.async_runner.run_io(func, *args))
+
+    def close_trial_exporters(self):
+        """關閉匯出檔案；連續施測時可共用的檔案保持開啟"""
+        exporters = [
+            exporter
+            for exporter in self.trial_exporters
+            if exporter.path not in self.open_exporters
+        ]
+        self.run_io(close_trial_exporters, exporters)
+        self.trial_exporters = []
+
+    def sample_telemetry(self, label):
+        """記錄一筆資源使用量（未開啟取樣時不做事）"""
+        if self.telemetry is None:
+            return
+        self.telemetry.sample(
+            label,
+            widget_count=len(self.root.winfo_children()),
+            stage=self.current_stage,
+            trials=self.trial_counter,
+            summary_cells=sum(len(column) for column in self.summary_data.values()),
+            pending_results=sum(len(stage) for stage in self.results_data.values()),
+        )
+
+    def close_telemetry(self):
+        if self.telemetry is not None:
+            self.sample_telemetry("session_end")
+            self.telemetry.close()
+            self.telemetry = None
+
     def get_stage_prefix(self, stage):
         """根據當前的階段返回對應的前綴"""
-        if stage == "practice":
-            return "prac"
-        elif stage == "formal":
-            return "nofb"
-        elif stage == "reward":
-            return "rfb"
-        elif stage == "penalty":
-            return "pfb"
-        elif stage == "reward_penalty":
-            return "rpfb"
-        else:
-            raise ValueError(f"未知的階段: {stage}")
+        return get_stage_spec(stage).prefix
 
     def calculate_lexical_accuracy(self):
         """計算真詞和假詞的總正確率"""
@@ -910,114 +1472,15 @@ class LanguageProcessingTestSystem:
             return 0
         return (self.pm_target_correct / self.pm_target_count) * 100
 
-    def save_results(self):
+    def save_results(self, session_data=None, group=None, participant_name=None):
         """保存結果到Excel文件"""
-        filename = f"{self.group}.xlsx"
-        if not os.path.exists(filename):
-            workbook = openpyxl.Workbook()
-            # 如果是新文件，先移除默認創建的工作表
-            workbook.remove(workbook.active)
-        else:
-            # 文件存在，則打開該文件
-            workbook = openpyxl.load_workbook(filename)
-
-        # 如果已有以 participant_name 命名的工作表，刪除該工作表以覆蓋
-        if self.participant_name in workbook.sheetnames:
-            del workbook[self.participant_name]
-
-        # 創建一個新的工作表
-        worksheet = workbook.create_sheet(title=self.participant_name)
-
-        # 處理每個階段的數據
-        for stage in ["prac", "nofb", "rfb", "pfb", "rpfb"]:
-            print("===============")
-            print(f"stage:{stage}")
-            # 根據階段名稱動態生成對應的欄位名稱
-            lexical_key = f"lexical_{stage}"
-            keyresponse_key = f"keyresponse_{stage}"
-            lexical_ans_key = f"lexical_ans_{stage}"
-            lexical_crate_key = f"lexical_crate_{stage}"
-            phonetic_ans_key = f"phonetic_ans_{stage}"
-            phonetic_crate_key = f"phonetic_crate_{stage}"
-            reactiontime_key = f"reactiontime_{stage}"
-            reactiontime_avg_key = f"reactiontime_avg_{stage}"
-            accum_key = f"accum_{stage}" if stage in ["rfb", "pfb", "rpfb"] else None
-
-            # 獲取對應欄位的數據
-            if self.summary_data[lexical_key]:
-                max_len = max(
-                    len(self.summary_data[lexical_key]),
-                    len(self.summary_data[keyresponse_key]),
-                    len(self.summary_data[lexical_ans_key]),
-                    len(self.summary_data[lexical_crate_key]),
-                    len(self.summary_data[phonetic_ans_key]),
-                    len(self.summary_data[phonetic_crate_key]),
-                    len(self.summary_data[reactiontime_key]),
-                    len(self.summary_data[reactiontime_avg_key]),
-                    len(self.summary_data[accum_key])
-                    if accum_key
-                    else 0,  # 新增金錢變化的欄位長度
-                )
-
-                # 將所有列表填充到相同長度
-                time_list = [self.summary_data["time"][0]] + [""] * (max_len - 1)
-                practice_list = [""] * max_len
-
-                self.summary_data[lexical_key] += [""] * (
-                    max_len - len(self.summary_data[lexical_key])
-                )
-                self.summary_data[keyresponse_key] += [""] * (
-                    max_len - len(self.summary_data[keyresponse_key])
-                )
-                self.summary_data[lexical_ans_key] += [""] * (
-                    max_len - len(self.summary_data[lexical_ans_key])
-                )
-                self.summary_data[lexical_crate_key] += [""] * (
-                    max_len - len(self.summary_data[lexical_crate_key])
-                )
-                self.summary_data[phonetic_ans_key] += [""] * (
-                    max_len - len(self.summary_data[phonetic_ans_key])
-                )
-                self.summary_data[phonetic_crate_key] += [""] * (
-                    max_len - len(self.summary_data[phonetic_crate_key])
-                )
-                self.summary_data[reactiontime_key] += [""] * (
-                    max_len - len(self.summary_data[reactiontime_key])
-                )
-                self.summary_data[reactiontime_avg_key] += [""] * (
-                    max_len - len(self.summary_data[reactiontime_avg_key])
-                )
-                if accum_key:  # 如果有累積金額的欄位，填充到相同長度
-                    self.summary_data[accum_key] += [""] * (
-                        max_len - len(self.summary_data[accum_key])
-                    )
-                # 構建 summary_data 字典
-                summary_data = {
-                    "time": time_list,
-                    f"{stage}": practice_list,
-                    lexical_key: self.summary_data[lexical_key],
-                    keyresponse_key: self.summary_data[keyresponse_key],
-                    lexical_ans_key: self.summary_data[lexical_ans_key],
-                    lexical_crate_key: self.summary_data[lexical_crate_key],
-                    phonetic_ans_key: self.summary_data[phonetic_ans_key],
-                    phonetic_crate_key: self.summary_data[phonetic_crate_key],
-                    reactiontime_key: self.summary_data[reactiontime_key],
-                    reactiontime_avg_key: self.summary_data[reactiontime_avg_key],
-                }
-                print(f"summary_data")
-                print(summary_data)
-                # 新增金錢變化的欄位
-                print("accum_key")
-                print(accum_key)
-                if accum_key:
-                    summary_data[accum_key] = self.summary_data[accum_key]
-                summary_df = pd.DataFrame(summary_data)
-
-                for r in dataframe_to_rows(summary_df, index=False, header=True):
-                    worksheet.append(r)
-
-            # 保存 Excel 文件
-            workbook.save(filename)
+        if session_data is None:
+            session_data = self.summary_data
+        group = group if group is not None else self.group
+        participant_name = (
+            participant_name if participant_name is not None else self.participant_name
+        )
+        save_results_workbook(session_data, group, participant_name)
 
     def show_thank_you_message(self):
         """顯示銘謝詞並停留"""
@@ -1032,10 +1495,23 @@ class LanguageProcessingTestSystem:
             bg="black",
         )
         self.instructions_label.pack(expand=True)
+        if self.kiosk:
+            # 連續施測：停留一段時間後回到輸入畫面，換下一位參與者
+            self.root.after(self.kiosk_return_ms, self.start_next_session)
         # 不綁定任何事件，停留在此屏幕
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="詞彙判斷試驗系統")
+    parser.add_argument(
+        "--realtime",
+        action="store_true",
+        help="Linux：刺激程序固定在專用核心並提高優先權，存檔移到低優先權背景程序",
+    )
+    parser.add_argument("--cpu", type=int, help="刺激程序使用的核心（預設為最後一個）")
+    parser.add_argument("--rt-priority", type=int, default=20)
+    args = parser.parse_args()
+
     root = tk.Tk()
     app = LanguageProcessingTestSystem(
         root,
@@ -1048,4 +1524,19 @@ if __name__ == "__main__":
             "formal",
         ],
     )
-    root.mainloop()
+    executor = None
+    if args.realtime:
+        if not hasattr(os, "sched_setaffinity"):
+            parser.error("--realtime 只支援 Linux")
+        cpu, worker_cpus = choose_cpus(args.cpu)
+        # 先啟動背景程序，再提高本程序的優先權，背景程序不會繼承即時排程
+        executor, worker = create_background_executor(worker_cpus)
+        app.realtime = enable_realtime(cpu, args.rt_priority)
+        app.realtime["worker"] = worker
+        print(f"Realtime mode: {app.realtime}")
+    # Tk 與 asyncio 交錯執行，存檔與上傳不阻塞刺激呈現
+    app.async_runner = AsyncTkRunner(
+        root, executor=executor, error_log="background_errors.log"
+    )
+    app.async_runner.on_error = app.report_background_error
+    app.async_runner.run()
@@ -0,0 +1,61 @@
+import os
+
+import openpyxl
+
+# 馬拉松模式的階段摘要欄位（每完成一個階段一列）
+STAGE_SUMMARY_FIELDS = [
+    "stage",
+    "repetition",
+    "trials",
+    "lexical_crate",
+    "phonetic_crate",
+    "reactiontime_avg",
+    "final_balance",
+]
+
+
+class LazyTimeline:
+    """依序存取時才編譯的時間軸
+
+    馬拉松模式下 stage_order 可能重複很多次、每個階段有數千個試次，事先編譯
+    整個時間軸會讓記憶體隨施測長度增加；這裡只保留最近編譯的一個階段，
+    在顯示指導語時才編譯下一個階段。
+    """
+
+    def __init__(self, stages, compile_block):
+        self.stages = tuple(stages)
+        self.compile_block = compile_block
+        self.cached = {}
+
+    def __len__(self):
+        return len(self.stages)
+
+    def __getitem__(self, index):
+        if index not in self.cached:
+            self.cached = {index: self.compile_block(self.stages[index])}
+        return self.cached[index]
+
+    def replace(self, index, block):
+        """以重新編譯的階段取代（例如重做練習）"""
+        self.cached = {index: block}
+
+
+def save_stage_summaries_workbook(stage_summaries, group, participant_name):
+    """將馬拉松模式的階段摘要寫入 <組別>.xlsx 的參與者工作表
+
+    逐試次的資料已在施測期間分批寫入試次匯出檔，活頁簿只保存每個階段一列的摘要。
+    """
+    filename = f"{group}.xlsx"
+    if os.path.exists(filename):
+        workbook = openpyxl.load_workbook(filename)
+    else:
+        workbook = openpyxl.Workbook()
+        workbook.remove(workbook.active)
+
+    if participant_name in workbook.sheetnames:
+        del workbook[participant_name]
+    worksheet = workbook.create_sheet(title=participant_name)
+    worksheet.append(STAGE_SUMMARY_FIELDS)
+    for summary in stage_summaries:
+        worksheet.append([summary[field] for field in STAGE_SUMMARY_FIELDS])
+    workbook.save(filename)
@@ -0,0 +1,149 @@
+import ctypes
+import ctypes.util
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+try:  # resource 只在 Unix 上可用
+    import resource
+except ImportError:
+    resource = None
+
+# mlockall 旗標（Linux）
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+# 背景程序的 nice 值（數字越大優先權越低）
+WORKER_NICE = 10
+
+SCHEDULER_NAMES = {
+    getattr(os, name): name
+    for name in ("SCHED_OTHER", "SCHED_BATCH", "SCHED_IDLE", "SCHED_FIFO", "SCHED_RR")
+    if hasattr(os, name)
+}
+
+
+def describe_process():
+    """回傳目前程序實際取得的 CPU、排程與優先權設定"""
+    info = {"pid": os.getpid(), "platform": sys.platform}
+    if hasattr(os, "sched_getaffinity"):
+        info["cpus"] = sorted(os.sched_getaffinity(0))
+    if hasattr(os, "sched_getscheduler"):
+        policy = os.sched_getscheduler(0)
+        info["scheduler"] = SCHEDULER_NAMES.get(policy, policy)
+        info["rt_priority"] = os.sched_getparam(0).sched_priority
+    if hasattr(os, "getpriority"):
+        info["nice"] = os.getpriority(os.PRIO_PROCESS, 0)
+    return info
+
+
+def choose_cpus(cpu=None):
+    """選出刺激程序專用的核心與背景程序可用的其餘核心
+
+    未指定時使用可用核心中編號最大的一個（通常較少被系統中斷佔用）。
+    只有一個核心時兩者共用。
+    """
+    available = sorted(os.sched_getaffinity(0))
+    if cpu is None:
+        cpu = available[-1]
+    if cpu not in available:
+        raise ValueError(f"CPU {cpu} 不在可用核心 {available} 之中")
+    others = [core for core in available if core != cpu] or [cpu]
+    return cpu, others
+
+
+def lock_memory():
+    """鎖定記憶體避免被換出，回傳實際鎖定的範圍
+
+    RLIMIT_MEMLOCK 有上限且非 root 時只鎖定目前的頁面：若連之後配置的頁面也
+    鎖定，超過上限後的配置會失敗。
+    """
+    libc_name = ctypes.util.find_library("c")
+    if libc_name is None:
+        return {"locked": False, "error": "找不到 libc"}
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+
+    flags = MCL_CURRENT | MCL_FUTURE
+    if resource is not None and os.geteuid() != 0:
+        _, hard_limit = resource.getrlimit(resource.RLIMIT_MEMLOCK)
+        if hard_limit != resource.RLIM_INFINITY:
+            flags = MCL_CURRENT
+
+    if libc.mlockall(flags) != 0:
+        return {"locked": False, "error": os.strerror(ctypes.get_errno())}
+    return {
+        "locked": True,
+        "scope": "current+future" if flags & MCL_FUTURE else "current",
+    }
+
+
+def raise_priority(rt_priority):
+    """嘗試改用 SCHED_FIFO；沒有權限時退而調低 nice 值，都失敗則維持原狀"""
+    attempts = []
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(rt_priority))
+        return {"method": "SCHED_FIFO", "attempts": attempts}
+    except (OSError, AttributeError) as e:
+        attempts.append(f"SCHED_FIFO: {e}")
+    try:
+        os.setpriority(os.PRIO_PROCESS, 0, -10)
+        return {"method": "nice", "attempts": attempts}
+    except (OSError, AttributeError) as e:
+        attempts.append(f"nice: {e}")
+    return {"method": None, "attempts": attempts}
+
+
+def enable_realtime(cpu, rt_priority=20, mlock=True):
+    """將目前的執行緒（Tk 主迴圈）固定在指定核心、提高優先權並鎖定記憶體
+
+    各項設定能做到多少就做多少，回傳要求與實際取得的結果，寫入工作階段附檔。
+    應在背景程序啟動之後呼叫，避免背景程序繼承即時排程與專用核心。
+    """
+    report = {
+        "requested": {"cpu": cpu, "rt_priority": rt_priority, "mlock": mlock},
+    }
+    try:
+        os.sched_setaffinity(0, {cpu})
+    except OSError as e:
+        report["affinity_error"] = str(e)
+    report["priority"] = raise_priority(rt_priority)
+    report["memory"] = lock_memory() if mlock else {"locked": False}
+    report["obtained"] = describe_process()
+    return report
+
+
+def demote_worker(cpus):
+    """背景程序的 initializer：離開專用核心、回到一般排程並降低優先權"""
+    try:
+        os.sched_setscheduler(0, os.SCHED_OTHER, os.sched_param(0))
+    except (OSError, AttributeError):
+        pass
+    try:
+        os.sched_setaffinity(0, cpus)
+    except (OSError, AttributeError):
+        pass
+    try:
+        os.setpriority(os.PRIO_PROCESS, 0, WORKER_NICE)
+    except (OSError, AttributeError):
+        pass
+
+
+def create_background_executor(cpus):
+    """建立執行存檔等非計時工作的單一背景程序，並等待它完成啟動
+
+    以 spawn 啟動，不複製 Tk 連線；回傳 (executor, 背景程序的設定)。
+    """
+    executor = ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=demote_worker,
+        initargs=(cpus,),
+    )
+    return executor, executor.submit(describe_process).result()
+
+
+def write_session_metadata(path, metadata):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(metadata, file, ensure_ascii=False, indent=4)
@@ -0,0 +1,234 @@
+"""以修正後的 words_config 重新計分已存檔的試次
+
+答案鍵修正（例如某個詞被誤分為真詞）後，逐試次匯出檔中的 correct_response、
+Excel 中的 lexical_crate / phonetic_crate 與金額軌跡都需要重算。本工具以欄位
+方式載入試次檔，向量化重新計算每個試次的正確與否、各階段正確率與金額軌跡，
+多個組別檔案平行處理，並輸出與原始計分的差異：
+
+    python rescore.py <新 words_config.json> <輸出前綴> <試次檔> [<試次檔> ...]
+
+試次檔可為逐試次匯出檔或施測時存的 <組別>.xlsx 活頁簿（只有活頁簿的舊施測），
+活頁簿的區塊切分方式見 analysis.read_workbook_trials。
+
+輸出 <前綴>_summary.csv（每位參與者 × 階段的新舊正確率與最終金額）與
+<前綴>_changes.csv（答案、正確與否或金額有變動的試次）。
+"""
+
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from analysis import load_trials
+from session import STAGE_SPECS
+
+# 每次獎勵或懲罰的金額（與 main.py reward_user / penalize_user 一致）
+BALANCE_STEP = 10
+
+RUN_COLUMNS = ["group", "participant", "session", "block", "stage", "run"]
+
+
+def answer_key_table(types):
+    """由 words_config 的 types 區塊建立 (階段前綴, 詞彙) → 正確按鍵 的表格
+
+    回傳 (表格, 階段前綴 → PM 按鍵)。鍵名順序與 select_words_for_stage 相同：
+    第一個為真詞、第二個為假詞、第三個為 PM target，"lexicon" 略過。
+    """
+    rows = []
+    pm_keys = {}
+    for stage, stage_words in types.items():
+        if stage not in STAGE_SPECS:
+            continue
+        prefix = STAGE_SPECS[stage].prefix
+        word_types = [key for key in stage_words if key != "lexicon"]
+        pm_keys[prefix] = word_types[2]
+        for key in word_types[:3]:
+            rows += [(prefix, word, key) for word in stage_words[key]]
+
+    table = pd.DataFrame(rows, columns=["stage", "word", "new_response"])
+    duplicated = table.duplicated(["stage", "word"], keep="last")
+    for stage, word in table.loc[duplicated, ["stage", "word"]].itertuples(index=False):
+        print(f"Warning: {stage} 的「{word}」出現在多個類型中，以最後一個為準")
+    return table[~duplicated], pm_keys
+
+
+def mark_runs(trials, path=""):
+    """依施測時寫入的 session 與 block 欄位為每個區塊編號 run
+
+    重做或重複的階段、同名參與者在同一個檔案中的多次施測各自獨立。舊版匯出檔
+    沒有這兩個欄位時無法可靠區分，直接報錯。
+    """
+    missing = [column for column in ("session", "block") if column not in trials]
+    if missing:
+        raise ValueError(
+            f"{path} 沒有 {'、'.join(missing)} 欄位（舊版程式匯出），"
+            "無法區分重做或重複的階段與不同次施測"
+        )
+    trials["session"] = trials["session"].astype(str)
+    trials["run"] = trials.groupby(
+        ["group", "participant", "session", "block"], sort=False
+    ).ngroup()
+    trials["trial"] = trials.groupby("run").cumcount()
+    return trials
+
+
+def score(trials, answer_column, pm_keys):
+    """以 answer_column 為正確答案，向量化計算 correct、is_pm 與金額軌跡
+
+    金額規則取自 STAGE_SPECS：PM target 答對且 reward_on_hit 時 +BALANCE_STEP，
+    答錯或超時且 penalty_on_miss 時 -BALANCE_STEP；沒有金額的階段為 NaN。
+    """
+    stage = trials["stage"]
+    specs = {spec.prefix: spec for spec in STAGE_SPECS.values()}
+    reward = stage.map({p: s.reward_on_hit for p, s in specs.items()}).fillna(False)
+    penalty = stage.map({p: s.penalty_on_miss for p, s in specs.items()}).fillna(False)
+    initial = stage.map({p: s.initial_balance for p, s in specs.items()})
+
+    answer = trials[answer_column].to_numpy()
+    correct = trials["response"].to_numpy() == answer
+    is_pm = answer == stage.map(pm_keys).to_numpy()
+    delta = np.where(is_pm & correct & reward.to_numpy(bool), BALANCE_STEP, 0)
+    delta -= np.where(is_pm & ~correct & penalty.to_numpy(bool), BALANCE_STEP, 0)
+    balance = initial.to_numpy(float) + pd.Series(delta).groupby(
+        trials["run"].to_numpy()
+    ).cumsum().to_numpy(float)
+    return correct, is_pm, balance
+
+
+def summarize(trials, correct, is_pm, balance):
+    """每個 run 的 lexical_crate、phonetic_crate（%，小數兩位）與最終金額"""
+    frame = pd.DataFrame(
+        {
+            "lexical_n": ~is_pm,
+            "lexical_correct": ~is_pm & correct,
+            "pm_n": is_pm,
+            "pm_correct": is_pm & correct,
+            "balance": balance,
+        }
+    )
+    for column in RUN_COLUMNS:
+        frame[column] = trials[column].to_numpy()
+    grouped = frame.groupby(RUN_COLUMNS, sort=False)
+    counts = grouped[["lexical_n", "lexical_correct", "pm_n", "pm_correct"]].sum()
+    summary = pd.DataFrame(index=counts.index)
+    for measure, n, hits in [
+        ("lexical_crate", "lexical_n", "lexical_correct"),
+        ("phonetic_crate", "pm_n", "pm_correct"),
+    ]:
+        total = counts[n].to_numpy(float)
+        summary[measure] = np.round(
+            np.divide(
+                counts[hits].to_numpy(float) * 100,
+                total,
+                out=np.zeros_like(total),
+                where=total > 0,
+            ),
+            2,
+        )
+    summary["final_balance"] = grouped["balance"].last()
+    return summary
+
+
+def rescore_file(path, key_table, pm_keys):
+    """重新計分單一試次檔，回傳 (摘要, 有變動的試次, 不在新答案鍵中的詞)"""
+    trials = load_trials([path])
+    trials["group"] = trials["group"].astype(str)
+    trials = mark_runs(trials, path)
+    trials = trials.merge(key_table, on=["stage", "word"], how="left", sort=False)
+    trials["in_key"] = trials["new_response"].notna()
+    trials["new_response"] = trials["new_response"].fillna(trials["correct_response"])
+
+    old_correct, old_pm, old_balance = score(trials, "correct_response", pm_keys)
+    new_correct, new_pm, new_balance = score(trials, "new_response", pm_keys)
+
+    old = summarize(trials, old_correct, old_pm, old_balance)
+    new = summarize(trials, new_correct, new_pm, new_balance)
+    summary = old.join(new, lsuffix="_old", rsuffix="_new").reset_index()
+    summary["file"] = path
+    key_changed = trials["correct_response"] != trials["new_response"]
+    summary["changed_answers"] = summary["run"].map(
+        key_changed.groupby(trials["run"]).sum()
+    )
+
+    balance_changed = ~np.isclose(old_balance, new_balance, equal_nan=True)
+    changed = key_changed.to_numpy() | (old_correct != new_correct) | balance_changed
+    changes = trials.loc[
+        changed,
+        RUN_COLUMNS + ["trial", "word", "response", "correct_response", "new_response"],
+    ].assign(
+        correct_old=old_correct[changed],
+        correct_new=new_correct[changed],
+        balance_old=old_balance[changed],
+        balance_new=new_balance[changed],
+        file=path,
+    )
+    unknown = trials.loc[~trials["in_key"], ["stage", "word"]].drop_duplicates()
+    return summary, changes, unknown
+
+
+def rescore(paths, types, workers=None):
+    """平行重新計分多個試次檔（每個檔案一個程序）
+
+    回傳 (摘要, 有變動的試次, 不在新答案鍵中的詞)。
+    """
+    key_table, pm_keys = answer_key_table(types)
+    workers = min(len(paths), workers or os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(rescore_file, paths, repeat(key_table), repeat(pm_keys))
+            )
+    else:
+        results = [rescore_file(path, key_table, pm_keys) for path in paths]
+
+    summaries, changes, unknown = zip(*results)
+    return (
+        pd.concat(summaries, ignore_index=True),
+        pd.concat(changes, ignore_index=True),
+        pd.concat(unknown, ignore_index=True).drop_duplicates(),
+    )
+
+
+def main(argv):
+    if len(argv) < 4:
+        print(
+            "用法: python rescore.py <新 words_config.json> <輸出前綴>"
+            " <試次檔> [<試次檔> ...]"
+        )
+        return 1
+    with open(argv[1], "r", encoding="utf-8") as file:
+        types = json.load(file)["types"]
+
+    try:
+        summary, changes, unknown = rescore(argv[3:], types)
+    except ValueError as e:
+        print(e)
+        return 1
+    summary.to_csv(f"{argv[2]}_summary.csv", index=False)
+    changes.to_csv(f"{argv[2]}_changes.csv", index=False)
+
+    affected = summary[
+        (summary["lexical_crate_old"] != summary["lexical_crate_new"])
+        | (summary["phonetic_crate_old"] != summary["phonetic_crate_new"])
+        | ~np.isclose(
+            summary["final_balance_old"],
+            summary["final_balance_new"],
+            equal_nan=True,
+        )
+    ]
+    print(
+        f"{len(summary)} 個階段中有 {len(affected)} 個的正確率或金額改變，"
+        f"{len(changes)} 個試次有變動"
+    )
+    if len(unknown):
+        print(f"{len(unknown)} 個詞不在新的答案鍵中（例如由詞庫抽樣），沿用原本的答案")
+    print(f"寫入 {argv[2]}_summary.csv 與 {argv[2]}_changes.csv")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,272 @@
+from collections import namedtuple
+
+# 詞彙類型代碼
+TRUE_WORD = 0
+FALSE_WORD = 1
+PM_TARGET = 2
+
+# 每個試次的預設時間（毫秒）
+BLANK_MS = 500  # 單詞前的黑屏
+STIMULUS_MS = 3000  # 作答時限
+FEEDBACK_MS = 1500  # 獎懲訊息停留時間
+
+StageSpec = namedtuple(
+    "StageSpec",
+    [
+        "prefix",  # summary_data 欄位前綴
+        "title",  # 指導語上方的標題（無則為 None）
+        "instructions",  # 指導語
+        "pm_symbols",  # 注音含有這些符號的詞為 PM target
+        "reward_on_hit",  # PM target 答對時加錢
+        "penalty_on_miss",  # PM target 答錯或超時時扣錢
+        "initial_balance",  # 階段開始時的金額（不顯示金額則為 None）
+    ],
+)
+
+STAGE_SPECS = {
+    "practice": StageSpec(
+        "prac",
+        "練習階段",
+        "真實的詞彙請按「A」，非真實的詞彙請按「L」，\n"
+        "但當詞彙中的注音包含「ㄍ」或「ㄐ」時，請按「空白鍵」。\n",
+        "ㄍㄐ",
+        False,
+        False,
+        None,
+    ),
+    "formal": StageSpec(
+        "nofb",
+        None,
+        "真實的詞彙請按「A」，非真實的詞彙請按「L」\n"
+        "但當詞彙中的注音含有「ㄅ」或「ㄉ」時，請按「空白鍵」。\n",
+        "ㄅㄉ",
+        False,
+        False,
+        None,
+    ),
+    "reward": StageSpec(
+        "rfb",
+        None,
+        "真實的詞彙請按「A」，非真實的詞彙請按「L」\n"
+        "但當詞彙中的注音含有「ㄆ」或「ㄊ」時，請按「空白鍵」。\n"
+        "\n"
+        "每當您正確辨認出含有「ㄆ」與「ㄊ」的詞彙時，\n"
+        "會顯示您獲得10元，且會累計顯示於左上角，\n"
+        "若您了解此實驗的程序請按enter鍵開始。",
+        "ㄆㄊ",
+        True,
+        False,
+        200,
+    ),
+    "penalty": StageSpec(
+        "pfb",
+        None,
+        "請判斷螢幕上的詞彙是否為真實存在的詞彙，\n"
+        "真實的詞彙請按「A」，非真實的詞彙請按「L」\n"
+        "但當詞彙中的注音含有「ㄇ」或「ㄋ」時，請按「空白鍵」。\n"
+        "\n"
+        "每當您未正確辨認出含有「ㄇ」與「ㄋ」的詞彙時，\n"
+        "會顯示您被扣除10元，且會累計顯示於左上角，\n"
+        "若您了解此實驗的程序請按enter鍵開始。",
+        "ㄇㄋ",
+        False,
+        True,
+        200,
+    ),
+    "reward_penalty": StageSpec(
+        "rpfb",
+        None,
+        "請判斷螢幕上的詞彙是否為真實存在的詞彙，\n"
+        "真實的詞彙請按「A」，非真實的詞彙請按「L」\n"
+        "但當詞彙中的注音含有「ㄈ」或「ㄌ」時，請按「空白鍵」。\n"
+        "\n"
+        "每當您正確辨認出含有「ㄈ」的詞彙時，\n"
+        "會顯示您獲得10元，且會累計顯示於左上角，\n"
+        "每當您未正確辨認出含有「ㄌ」的詞彙時，\n"
+        "會顯示您被扣除10元，且會累計顯示於左上角，\n"
+        "若您了解此實驗的程序請按enter鍵開始。",
+        "ㄈㄌ",
+        True,
+        True,
+        200,
+    ),
+}
+
+
+class TrialDescriptor:
+    """create_word_list 產生的單一試次描述"""
+
+    __slots__ = ("word_id", "word", "word_type", "expected_key", "is_pm")
+
+    def __init__(self, word_id, word, word_type, expected_key):
+        self.word_id = word_id  # 階段內的詞彙編號
+        self.word = word
+        self.word_type = word_type  # TRUE_WORD / FALSE_WORD / PM_TARGET
+        self.expected_key = expected_key
+        self.is_pm = word_type == PM_TARGET
+
+
+class TrialRecord:
+    """單一試次的作答紀錄，詞彙與正確答案由事件提供，不重複存放"""
+
+    __slots__ = ("event", "response", "reaction_time", "gc_pause_ms")
+
+    def __init__(self, event, response, reaction_time, gc_pause_ms=""):
+        self.event = event
+        self.response = response
+        self.reaction_time = reaction_time
+        self.gc_pause_ms = gc_pause_ms
+
+    @property
+    def word(self):
+        return self.event.word
+
+    @property
+    def correct_response(self):
+        return self.event.correct_key
+
+    @property
+    def correct(self):
+        return self.response == self.event.correct_key
+
+
+TrialEvent = namedtuple(
+    "TrialEvent",
+    [
+        "word_id",
+        "word",
+        "word_type",  # TRUE_WORD / FALSE_WORD / PM_TARGET
+        "correct_key",  # 正確按鍵（即 words_config 中的類型鍵名）
+        "is_pm",
+        "stage",
+        "stage_prefix",
+        "accum_key",  # 金額欄位名稱，非金錢變化階段為 None
+        "reward_on_hit",
+        "penalty_on_miss",
+        "blank_ms",
+        "stimulus_ms",
+        "feedback_ms",
+    ],
+)
+
+StageBlock = namedtuple(
+    "StageBlock",
+    [
+        "stage",
+        "stage_prefix",
+        "title",
+        "instructions",
+        "initial_balance",
+        "show_balance",
+        "true_word_type",
+        "false_word_type",
+        "pm_target_type",
+        "events",  # tuple of TrialEvent
+    ],
+)
+
+
+def get_stage_spec(stage):
+    """取得階段的固定設定"""
+    try:
+        return STAGE_SPECS[stage]
+    except KeyError:
+        raise ValueError(f"未知的階段: {stage}")
+
+
+def validate_types(types):
+    """檢查 words_config 的 types 區塊，回傳問題清單（沒有問題時為空）
+
+    每個階段依序為真詞、假詞、PM target 三個類型（"lexicon" 為抽樣設定）；
+    PM target 的位置須在 1 到詞彙總長度之間且不重複，同一個詞不可屬於多個類型。
+    """
+    missing_stages = [stage for stage in STAGE_SPECS if stage not in types]
+    if missing_stages:
+        return [f"缺少以下階段的詞彙配置: {', '.join(missing_stages)}"]
+
+    errors = []
+    for stage in STAGE_SPECS:
+        stage_words = types[stage]
+        word_types = [key for key in stage_words if key != "lexicon"]
+        if len(word_types) < 3:
+            errors.append(f"階段 {stage} 需要真詞、假詞與 PM target 三個類型")
+            continue
+        true_words = stage_words[word_types[0]]
+        false_words = stage_words[word_types[1]]
+        pm_targets = stage_words[word_types[2]]
+        if not isinstance(true_words, list) or not isinstance(false_words, list):
+            errors.append(f"階段 {stage} 的真詞與假詞必須是清單")
+            continue
+        if not isinstance(pm_targets, dict):
+            errors.append(f"階段 {stage} 的 PM target 必須是「詞: 位置」")
+            continue
+
+        seen = {}
+        for word_type in word_types[:3]:
+            for word in stage_words[word_type]:
+                if word in seen and seen[word] != word_type:
+                    errors.append(
+                        f"階段 {stage} 的「{word}」同時屬於 {seen[word]} 與 {word_type}"
+                    )
+                seen[word] = word_type
+
+        sample_counts = stage_words.get("lexicon") or {}
+        total_words = (
+            len(set(true_words))
+            + len(set(false_words))
+            + len(pm_targets)
+            + sample_counts.get(word_types[0], 0)
+            + sample_counts.get(word_types[1], 0)
+        )
+        positions = {}
+        for target, pos in pm_targets.items():
+            if not isinstance(pos, int) or not 1 <= pos <= total_words:
+                errors.append(
+                    f"階段 {stage} 的 PM target「{target}」位置 {pos} 超出範圍"
+                    f"（詞彙總長度為 {total_words}）"
+                )
+            elif pos in positions:
+                errors.append(
+                    f"階段 {stage} 的「{positions[pos]}」與「{target}」位置重複: {pos}"
+                )
+            else:
+                positions[pos] = target
+    return errors
+
+
+def compile_stage(stage, word_list, true_word_type, false_word_type, pm_target_type):
+    """將一個階段排好順序的 TrialDescriptor 清單編譯成不可變的事件序列"""
+    spec = get_stage_spec(stage)
+    accum_key = f"accum_{spec.prefix}" if spec.initial_balance is not None else None
+
+    events = tuple(
+        TrialEvent(
+            word_id=descriptor.word_id,
+            word=descriptor.word,
+            word_type=descriptor.word_type,
+            correct_key=descriptor.expected_key,
+            is_pm=descriptor.is_pm,
+            stage=stage,
+            stage_prefix=spec.prefix,
+            accum_key=accum_key,
+            reward_on_hit=spec.reward_on_hit,
+            penalty_on_miss=spec.penalty_on_miss,
+            blank_ms=BLANK_MS,
+            stimulus_ms=STIMULUS_MS,
+            feedback_ms=FEEDBACK_MS,
+        )
+        for descriptor in word_list
+    )
+
+    return StageBlock(
+        stage=stage,
+        stage_prefix=spec.prefix,
+        title=spec.title,
+        instructions=spec.instructions,
+        initial_balance=spec.initial_balance,
+        show_balance=spec.initial_balance is not None,
+        true_word_type=true_word_type,
+        false_word_type=false_word_type,
+        pm_target_type=pm_target_type,
+        events=events,
+    )
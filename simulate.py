@@ -0,0 +1,317 @@
+"""研究設計的 Monte Carlo 模擬
+
+以 words_config 與 stage_order 編譯出與施測時相同的時間軸，再以 NumPy 陣列一次
+模擬數萬位參與者（每位參與者的正確率與 ex-Gaussian 反應時間參數各自抽樣），
+依 STAGE_SPECS 的獎懲規則計算金額軌跡，回報各階段最終金額、正確率與正確率估計
+誤差的分佈，方便比較不同的設定：
+
+    python simulate.py words_config.json [其他設定.json ...] --sessions 20000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from analysis import log_norm_cdf
+from main import LanguageProcessingTestSystem
+from session import FALSE_WORD, PM_TARGET, TRUE_WORD, validate_types
+
+# 每次獎勵或懲罰的金額（與 main.py reward_user / penalize_user 一致）
+BALANCE_STEP = 10
+
+# 練習重做的上限（施測時沒有上限，模擬時避免無窮迴圈）
+MAX_PRACTICE_ATTEMPTS = 20
+
+ParticipantModel = namedtuple(
+    "ParticipantModel",
+    [
+        "p_true",  # 真詞答對率（未超時時）
+        "p_false",  # 假詞答對率
+        "p_pm",  # PM target 答對率
+        "ability_sd",  # 參與者之間答對率的差異（logit 尺度的標準差）
+        "rt_mu",  # ex-Gaussian 反應時間參數（毫秒）
+        "rt_sigma",
+        "rt_tau",
+        "rt_sd",  # 參與者之間 mu、tau 的相對差異（對數尺度的標準差）
+        "pm_by_stage",  # 階段前綴 → PM 答對率，覆寫 p_pm（例如獎勵階段較高）
+    ],
+    defaults=(0.9, 0.85, 0.7, 0.5, 650.0, 80.0, 250.0, 0.15, {}),
+)
+
+
+def compile_timeline(types, stage_order):
+    """以施測程式的 compile_session 編譯練習與 stage_order 的時間軸"""
+    errors = validate_types(types)
+    if errors:
+        raise ValueError("\n".join(errors))
+    app = LanguageProcessingTestSystem(
+        None, stage_order=stage_order, export_formats=[], words_config=types
+    )
+    app.participant_name = "simulation"
+    with contextlib.redirect_stdout(io.StringIO()):
+        if not app.compile_session():
+            raise ValueError("無法編譯時間軸，請檢查 words_config")
+    return app.timeline
+
+
+def logit(p):
+    return np.log(p / (1 - p))
+
+
+def inverse_logit(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def draw_participants(model, count, rng):
+    """為每位模擬參與者抽樣答對率與反應時間參數（每個值為長度 count 的陣列）"""
+    return {
+        "p_true": inverse_logit(
+            logit(model.p_true) + rng.normal(0, model.ability_sd, count)
+        ),
+        "p_false": inverse_logit(
+            logit(model.p_false) + rng.normal(0, model.ability_sd, count)
+        ),
+        # PM 能力在各階段之間相關：每位參與者一個偏移，各階段的答對率另外指定
+        "pm_offset": rng.normal(0, model.ability_sd, count),
+        "rt_mu": model.rt_mu * np.exp(rng.normal(0, model.rt_sd, count)),
+        "rt_sigma": np.full(count, float(model.rt_sigma)),
+        "rt_tau": model.rt_tau * np.exp(rng.normal(0, model.rt_sd, count)),
+    }
+
+
+def in_time_probability(participants, stimulus_ms):
+    """ex-Gaussian 反應時間小於作答時限的機率（解析 CDF）
+
+    回傳形狀為 (參與者數, 試次數)。
+    """
+    mu = participants["rt_mu"][:, None]
+    sigma = participants["rt_sigma"][:, None]
+    tau = participants["rt_tau"][:, None]
+    z = (stimulus_ms - mu) / sigma
+    tail = -(stimulus_ms - mu) / tau + sigma**2 / (2 * tau**2)
+    return np.exp(log_norm_cdf(z)) - np.exp(tail + log_norm_cdf(z - sigma / tau))
+
+
+def simulate_block(block, participants, model, rng):
+    """模擬一個階段的所有試次
+
+    回傳 (每試次是否答對, 反應時間, 每試次的期望答對率)，形狀皆為
+    (參與者數, 試次數)。反應時間超過作答時限即為超時，一律算答錯。
+    """
+    events = block.events
+    count = len(participants["rt_mu"])
+    word_types = np.array([event.word_type for event in events], dtype=int)
+    stimulus_ms = np.array([event.stimulus_ms for event in events], dtype=float)
+
+    pm_rate = model.pm_by_stage.get(block.stage_prefix, model.p_pm)
+    # 欄位順序與 TRUE_WORD、FALSE_WORD、PM_TARGET 代碼相同，再依試次類型展開
+    p_type = np.stack(
+        [
+            participants["p_true"],
+            participants["p_false"],
+            inverse_logit(logit(pm_rate) + participants["pm_offset"]),
+        ],
+        axis=1,
+    )[:, word_types]
+
+    shape = (count, len(events))
+    rt = (
+        participants["rt_mu"][:, None]
+        + participants["rt_sigma"][:, None] * rng.standard_normal(shape)
+        + participants["rt_tau"][:, None] * rng.exponential(1.0, shape)
+    )
+    correct = (rt < stimulus_ms) & (rng.random(shape) < p_type)
+    expected = p_type * in_time_probability(participants, stimulus_ms)
+    return correct, np.minimum(rt, stimulus_ms), expected
+
+
+def score_block(block, correct, rt, expected):
+    """各參與者的正確率、正確率估計誤差、平均反應時間與金額軌跡
+
+    計分規則與施測時相同：PM target 答對且 reward_on_hit 時加錢，
+    答錯或超時且 penalty_on_miss 時扣錢。
+    """
+    word_types = np.array([event.word_type for event in block.events], dtype=int)
+    is_pm = word_types == PM_TARGET
+    result = {"rt_mean": rt.mean(axis=1)}
+
+    for measure, mask in [("lexical", ~is_pm), ("phonetic", is_pm)]:
+        if mask.any():
+            observed = correct[:, mask].mean(axis=1)
+            result[f"{measure}_crate"] = observed * 100
+            # 觀察到的正確率與該參與者真實期望值的差（百分點）
+            result[f"{measure}_error"] = (
+                observed - expected[:, mask].mean(axis=1)
+            ) * 100
+
+    if block.initial_balance is not None:
+        reward = np.array([event.reward_on_hit for event in block.events])
+        penalty = np.array([event.penalty_on_miss for event in block.events])
+        delta = np.where(is_pm & reward & correct, BALANCE_STEP, 0)
+        delta -= np.where(is_pm & penalty & ~correct, BALANCE_STEP, 0)
+        balance = block.initial_balance + np.cumsum(delta, axis=1)
+        result["final_balance"] = balance[:, -1]
+        result["min_balance"] = balance.min(axis=1)
+    return result
+
+
+def subset(participants, index):
+    return {key: value[index] for key, value in participants.items()}
+
+
+def simulate_practice(block, participants, model, rng, threshold=0.8):
+    """練習重做到真詞與假詞答對率都達到門檻為止（與 end_practice 相同）
+
+    回傳每位參與者最後一次練習的結果與練習次數。
+    """
+    count = len(participants["rt_mu"])
+    word_types = np.array([event.word_type for event in block.events], dtype=int)
+    result = {"attempts": np.zeros(count)}
+    pending = np.arange(count)
+    for _ in range(MAX_PRACTICE_ATTEMPTS):
+        correct, rt, expected = simulate_block(
+            block, subset(participants, pending), model, rng
+        )
+        result["attempts"][pending] += 1
+        for key, value in score_block(block, correct, rt, expected).items():
+            result.setdefault(key, np.full(count, np.nan))[pending] = value
+
+        passed = np.ones(len(pending), dtype=bool)
+        for word_type in (TRUE_WORD, FALSE_WORD):
+            mask = word_types == word_type
+            if mask.any():
+                passed &= correct[:, mask].mean(axis=1) >= threshold
+        pending = pending[~passed]
+        if not len(pending):
+            break
+    return result
+
+
+def simulate(timeline, model, sessions, seed=0, chunk_trials=2_000_000):
+    """模擬 sessions 位參與者走完整個時間軸
+
+    回傳 {(階段標籤, 指標): 長度 sessions 的陣列}；同一階段在 stage_order 中
+    重複出現時標籤加上序號。為限制記憶體，參與者分批模擬，每批最多約
+    chunk_trials 個試次。
+    """
+    rng = np.random.default_rng(seed)
+    total_trials = max(1, sum(len(block.events) for block in timeline))
+    chunk = max(1, min(sessions, chunk_trials // total_trials))
+
+    labels = []
+    for block in timeline:
+        label = block.stage_prefix
+        repeat = sum(1 for other in labels if other.split("#")[0] == label)
+        labels.append(f"{label}#{repeat + 1}" if repeat else label)
+
+    results = {}
+    for start in range(0, sessions, chunk):
+        participants = draw_participants(model, min(chunk, sessions - start), rng)
+        balance = np.full(len(participants["rt_mu"]), np.nan)
+        for label, block in zip(labels, timeline):
+            if block.stage == "practice":
+                scores = simulate_practice(block, participants, model, rng)
+            else:
+                scores = score_block(
+                    block, *simulate_block(block, participants, model, rng)
+                )
+            if "final_balance" in scores:
+                balance = scores["final_balance"]
+            for metric, values in scores.items():
+                results.setdefault((label, metric), []).append(values)
+        # 施測結束時畫面上的 current_balance 為最後一個金錢階段的金額
+        results.setdefault(("session", "final_balance"), []).append(balance)
+    return {key: np.concatenate(values) for key, values in results.items()}
+
+
+def summarize(results):
+    """每個階段與指標的分佈摘要；*_error 另外回報 RMSE 作為估計精確度"""
+    rows = []
+    for (stage, metric), values in results.items():
+        values = values[~np.isnan(values)]
+        if not len(values):
+            continue
+        p5, p50, p95 = np.percentile(values, [5, 50, 95])
+        rows.append(
+            {
+                "stage": stage,
+                "metric": metric,
+                "mean": values.mean(),
+                "sd": values.std(ddof=1) if len(values) > 1 else np.nan,
+                "p5": p5,
+                "median": p50,
+                "p95": p95,
+                "rmse": (
+                    np.sqrt(np.mean(values**2)) if metric.endswith("_error") else np.nan
+                ),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("configs", nargs="+", help="要比較的 words_config.json")
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--stage-order",
+        nargs="+",
+        default=["formal", "reward", "penalty", "reward_penalty"],
+    )
+    defaults = ParticipantModel()
+    for field in ParticipantModel._fields:
+        if field != "pm_by_stage":
+            parser.add_argument(
+                f"--{field.replace('_', '-')}",
+                type=float,
+                default=getattr(defaults, field),
+            )
+    parser.add_argument(
+        "--pm-stage",
+        action="append",
+        default=[],
+        metavar="前綴=答對率",
+        help="指定階段的 PM 答對率，例如 rfb=0.8（可重複）",
+    )
+    parser.add_argument("--output", help="將摘要寫成 CSV")
+    args = parser.parse_args(argv)
+
+    model = ParticipantModel(
+        *(
+            getattr(args, field)
+            for field in ParticipantModel._fields
+            if field != "pm_by_stage"
+        ),
+        pm_by_stage={
+            prefix: float(rate)
+            for prefix, rate in (item.split("=", 1) for item in args.pm_stage)
+        },
+    )
+
+    tables = []
+    for config_path in args.configs:
+        with open(config_path, "r", encoding="utf-8") as file:
+            types = json.load(file)["types"]
+        timeline = compile_timeline(types, args.stage_order)
+        table = summarize(simulate(timeline, model, args.sessions, args.seed))
+        table.insert(0, "config", config_path)
+        tables.append(table)
+    report = pd.concat(tables, ignore_index=True)
+
+    with pd.option_context("display.width", 200, "display.max_rows", None):
+        print(report.round(2).to_string(index=False))
+    if args.output:
+        report.to_csv(args.output, index=False)
+        print(f"寫入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
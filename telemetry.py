@@ -0,0 +1,100 @@
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+try:  # 有 psutil 時使用，否則讀取 /proc
+    import psutil
+except ImportError:
+    psutil = None
+
+# 會另外計數的物件類型（懷疑會隨施測時間累積）
+TRACKED_TYPES = ("dict", "function", "Label", "TrialEvent")
+
+
+def current_rss_bytes():
+    """目前的常駐記憶體；無法取得時回傳 None"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+
+        # ru_maxrss 為峰值：Linux 單位為 KB，macOS 為 bytes
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+def count_objects():
+    """回傳 (追蹤中的物件總數, 凍結的物件數, 指定類型的數量, lambda 數量)
+
+    gc.get_objects() 不含 gc.freeze() 凍結的物件（GC 安靜模式），總數另外加上
+    gc.get_freeze_count()；類型與 lambda 數量無法取得凍結的物件，只計未凍結的部分。
+    """
+    objects = gc.get_objects()
+    frozen = gc.get_freeze_count()
+    type_counts = Counter(type(obj).__name__ for obj in objects)
+    lambdas = sum(
+        1
+        for obj in objects
+        if type(obj).__name__ == "function" and obj.__name__ == "<lambda>"
+    )
+    return (
+        len(objects) + frozen,
+        frozen,
+        {name: type_counts[name] for name in TRACKED_TYPES},
+        lambdas,
+    )
+
+
+class ResourceTelemetry:
+    """在階段邊界與固定試次間隔取樣資源使用量，逐行寫入 JSON Lines 附檔"""
+
+    def __init__(self, path, trial_interval=0):
+        self.path = path
+        self.trial_interval = trial_interval  # 0 表示只在階段邊界取樣
+        self.started_tracemalloc = not tracemalloc.is_tracing()
+        if self.started_tracemalloc:
+            tracemalloc.start()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def due(self, trial_count):
+        """是否到了試次間隔取樣的時間"""
+        return self.trial_interval > 0 and trial_count % self.trial_interval == 0
+
+    def sample(self, label, widget_count=None, **extra):
+        heap_current, heap_peak = tracemalloc.get_traced_memory()
+        object_count, frozen_count, type_counts, lambdas = count_objects()
+        record = {
+            "time": time.time(),
+            "label": label,
+            "cpu_seconds": time.process_time(),
+            "rss_bytes": current_rss_bytes(),
+            "heap_bytes": heap_current,
+            "heap_peak_bytes": heap_peak,
+            "gc_objects": object_count,
+            "gc_frozen_objects": frozen_count,  # object_types 與 lambdas 不含這些
+            "object_types": type_counts,
+            "lambdas": lambdas,
+            "widgets": widget_count,
+        }
+        record.update(extra)
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        return record
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
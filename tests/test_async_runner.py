@@ -0,0 +1,17 @@
+"""AsyncTkRunner 的背景工作測試（不需要 Tk 視窗）"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from async_runner import AsyncTkRunner  # noqa: E402
+
+
+def test_drain_finishes_io_submitted_while_held():
+    runner = AsyncTkRunner(None)
+    runner.hold()
+    task = runner.submit(runner.run_io(lambda: 42))
+    runner.drain()
+    assert task.result() == 42
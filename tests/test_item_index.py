@@ -0,0 +1,42 @@
+"""ItemIndex 依區塊寫入與取代的測試"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from item_index import ItemIndex  # noqa: E402
+
+
+def make_rows(block, responses):
+    return [
+        {
+            "participant": "p1",
+            "group": "g1",
+            "session": "2026-01-01T10:00:00.000",
+            "stage": "nofb",
+            "block": block,
+            "word": "豆腐",
+            "response": response,
+            "correct_response": "a",
+            "reaction_time": 500,
+        }
+        for response in responses
+    ]
+
+
+def test_blocks_of_one_stage_are_all_counted(tmp_path):
+    index = ItemIndex(str(tmp_path / "items.sqlite"))
+    index.add_rows(make_rows(1, ["a", "l"]))
+    index.add_rows(make_rows(2, ["a", "a", ""]))
+    [stats] = index.item_stats("豆腐", "nofb")
+    assert stats["trials"] == 5
+    assert stats["accuracy"] == 3 / 5
+
+    # 再次寫入同一區塊時取代舊的試次，不重複計入
+    index.add_rows(make_rows(2, ["l"]))
+    [stats] = index.item_stats("豆腐", "nofb")
+    assert stats["trials"] == 3
+    assert stats["accuracy"] == 1 / 3
+    index.close()
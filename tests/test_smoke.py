@@ -0,0 +1,47 @@
+"""效能測試與研究設計模擬的冒煙測試
+
+兩個工具都以不建立畫面的方式使用 LanguageProcessingTestSystem，主程式新增屬性或
+改動資料路徑時，這裡能及早發現工具無法執行。
+"""
+
+import importlib.util
+import json
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import simulate  # noqa: E402
+
+
+def load_benchmark():
+    path = os.path.join(ROOT_DIR, "benchmarks", "bench_data_path.py")
+    spec = importlib.util.spec_from_file_location("bench_data_path", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_benchmark_runs():
+    bench = load_benchmark()
+    report = bench.run_benchmarks([10], [1], repeats=1)
+    names = {result["name"] for result in report["results"]}
+    assert {
+        "create_word_list",
+        "save_stage_results",
+        "save_stage_results_marathon",
+        "save_results",
+    } <= names
+
+
+def test_simulator_runs():
+    with open(
+        os.path.join(ROOT_DIR, "words_config.json"), "r", encoding="utf-8"
+    ) as file:
+        types = json.load(file)["types"]
+    timeline = simulate.compile_timeline(types, ["formal", "reward"])
+    results = simulate.simulate(timeline, simulate.ParticipantModel(), 50)
+    table = simulate.summarize(results)
+    assert set(table["stage"]) >= {"prac", "nofb", "rfb", "session"}
+    assert len(results[("rfb", "final_balance")]) == 50
@@ -0,0 +1,305 @@
+import json
+import os
+import random
+import re
+import sys
+from array import array
+
+from session import STAGE_SPECS
+
+try:  # 沒有注音字典檔時，可選用 pypinyin 產生索引
+    from pypinyin import Style, pinyin
+except ImportError:
+    pinyin = None
+
+# 注音符號 ㄅ(U+3105) ~ ㄯ(U+312F)，每個符號對應遮罩中的一個位元
+BOPOMOFO_FIRST = 0x3105
+BOPOMOFO_LAST = 0x312F
+
+CACHE_MAGIC = b"ZHUYIDX1"
+
+BOPOMOFO_PATTERN = re.compile(f"[{chr(BOPOMOFO_FIRST)}-{chr(BOPOMOFO_LAST)}]")
+
+
+def symbols_to_mask(symbols):
+    """將注音字串轉成位元遮罩（聲調等非注音符號忽略）"""
+    mask = 0
+    for symbol in symbols:
+        code = ord(symbol)
+        if BOPOMOFO_FIRST <= code <= BOPOMOFO_LAST:
+            mask |= 1 << (code - BOPOMOFO_FIRST)
+    return mask
+
+
+class ZhuyinIndex:
+    """字 → 注音符號遮罩的索引
+
+    每個字存兩個遮罩：any_mask 為所有讀音的聯集（破音字的任一讀音含有即算），
+    all_mask 為所有讀音的交集（每個讀音都含有才算）。
+    """
+
+    def __init__(self, readings=None):
+        self.any_masks = {}
+        self.all_masks = {}
+        for char, char_readings in (readings or {}).items():
+            self.add(char, char_readings)
+
+    def add(self, char, char_readings):
+        masks = [symbols_to_mask(reading) for reading in char_readings]
+        masks = [mask for mask in masks if mask]
+        if not masks:
+            return
+        any_mask = self.any_masks.get(char, 0)
+        all_mask = self.all_masks.get(char, ~0)
+        for mask in masks:
+            any_mask |= mask
+            all_mask &= mask
+        self.any_masks[char] = any_mask
+        self.all_masks[char] = all_mask
+
+    @classmethod
+    def from_dictionary(cls, path):
+        """由注音字典檔建立索引
+
+        每行為「字 讀音 [讀音 ...]」，以空白或 Tab 分隔；多字詞條與不含注音的欄位
+        （例如詞頻）會被略過，同一字出現多行時讀音合併。
+        """
+        index = cls()
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                fields = line.split()
+                if len(fields) < 2 or len(fields[0]) != 1:
+                    continue
+                readings = [
+                    field for field in fields[1:] if BOPOMOFO_PATTERN.search(field)
+                ]
+                index.add(fields[0], readings)
+        return index
+
+    @classmethod
+    def from_pypinyin(cls, first=0x4E00, last=0x9FFF):
+        """以 pypinyin 產生常用漢字範圍的索引"""
+        if pinyin is None:
+            raise RuntimeError(
+                "未提供注音字典檔，且未安裝 pypinyin：pip install pypinyin"
+            )
+        index = cls()
+        for code in range(first, last + 1):
+            char = chr(code)
+            readings = pinyin(char, style=Style.BOPOMOFO, heteronym=True)[0]
+            index.add(char, readings)
+        return index
+
+    def save(self, cache_path):
+        """以排序後的碼位與遮罩陣列寫成緊湊的二進位快取"""
+        chars = sorted(self.any_masks)
+        codes = array("I", (ord(char) for char in chars))
+        any_masks = array("Q", (self.any_masks[char] for char in chars))
+        all_masks = array("Q", (self.all_masks[char] for char in chars))
+        with open(cache_path, "wb") as file:
+            file.write(CACHE_MAGIC)
+            file.write(len(codes).to_bytes(4, "little"))
+            codes.tofile(file)
+            any_masks.tofile(file)
+            all_masks.tofile(file)
+
+    @classmethod
+    def load(cls, cache_path):
+        """讀取 save() 寫出的快取"""
+        with open(cache_path, "rb") as file:
+            if file.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                raise ValueError(f"{cache_path} 不是注音索引快取")
+            count = int.from_bytes(file.read(4), "little")
+            codes = array("I")
+            any_masks = array("Q")
+            all_masks = array("Q")
+            codes.fromfile(file, count)
+            any_masks.fromfile(file, count)
+            all_masks.fromfile(file, count)
+        index = cls()
+        chars = [chr(code) for code in codes]
+        index.any_masks = dict(zip(chars, any_masks))
+        index.all_masks = dict(zip(chars, all_masks))
+        return index
+
+    def word_masks(self, word):
+        """回傳 (any_mask, all_mask, 查不到的字)"""
+        any_mask = 0
+        all_mask = 0
+        unknown = []
+        for char in word:
+            if char.isspace():
+                continue
+            if char not in self.any_masks:
+                unknown.append(char)
+                continue
+            any_mask |= self.any_masks[char]
+            all_mask |= self.all_masks[char]  # 任一字確定含有即整個詞確定含有
+        return any_mask, all_mask, unknown
+
+    def classify_words(self, words, symbols):
+        """批次分類詞彙
+
+        回傳 dict：
+          "target": 每個讀音都含有指定符號的詞
+          "ambiguous": 只有破音字的部分讀音含有的詞
+          "clean": 不含指定符號的詞
+          "unknown": 含有索引中沒有的字的詞
+        """
+        symbol_mask = symbols_to_mask(symbols)
+        result = {"target": [], "ambiguous": [], "clean": [], "unknown": []}
+        for word in words:
+            any_mask, all_mask, unknown = self.word_masks(word)
+            if all_mask & symbol_mask:
+                result["target"].append(word)
+            elif unknown:
+                result["unknown"].append(word)
+            elif any_mask & symbol_mask:
+                result["ambiguous"].append(word)
+            else:
+                result["clean"].append(word)
+        return result
+
+
+def load_or_build_index(cache_path, dictionary_path=None):
+    """讀取快取；快取不存在或比字典檔舊時重新建立並寫入快取"""
+    if os.path.exists(cache_path) and (
+        dictionary_path is None
+        or os.path.getmtime(cache_path) >= os.path.getmtime(dictionary_path)
+    ):
+        return ZhuyinIndex.load(cache_path)
+
+    if dictionary_path:
+        index = ZhuyinIndex.from_dictionary(dictionary_path)
+    else:
+        index = ZhuyinIndex.from_pypinyin()
+    index.save(cache_path)
+    return index
+
+
+def audit_stage_words(index, stage, true_words, false_words, pm_targets):
+    """檢查單一階段：真假詞不應含有該階段的 PM 符號，PM target 應含有
+
+    回傳問題清單 dict，沒有問題的項目不列出。
+    """
+    symbols = STAGE_SPECS[stage].pm_symbols
+    fillers = index.classify_words(list(true_words) + list(false_words), symbols)
+    targets = index.classify_words(list(pm_targets), symbols)
+
+    issues = {}
+    if fillers["target"] or fillers["ambiguous"]:
+        issues["contaminated_fillers"] = fillers["target"] + fillers["ambiguous"]
+    if targets["clean"] or targets["ambiguous"]:
+        issues["targets_without_symbol"] = targets["clean"] + targets["ambiguous"]
+    unknown = fillers["unknown"] + targets["unknown"]
+    if unknown:
+        issues["unknown"] = unknown
+    return issues
+
+
+def audit_words_config(index, types):
+    """逐階段檢查 words_config 的 types 區塊"""
+    report = {}
+    for stage, stage_words in types.items():
+        if stage not in STAGE_SPECS:
+            continue
+        word_types = [key for key in stage_words if key != "lexicon"]
+        issues = audit_stage_words(
+            index,
+            stage,
+            stage_words[word_types[0]],
+            stage_words[word_types[1]],
+            stage_words[word_types[2]],
+        )
+        if issues:
+            report[stage] = issues
+    return report
+
+
+def generate_space_targets(
+    index, stage, candidates, count, total_words, rng=None, exclude=()
+):
+    """從候選詞中挑出確定含有該階段符號的詞，並隨機安排位置（1 起算）
+
+    exclude 中的詞（例如其他階段已選用的 PM target）不會被選入。
+    """
+    rng = rng or random.Random()
+    exclude = set(exclude)
+    candidates = [word for word in candidates if word not in exclude]
+    targets = index.classify_words(candidates, STAGE_SPECS[stage].pm_symbols)["target"]
+    if len(targets) < count:
+        raise ValueError(
+            f"階段 {stage} 可用的 PM target 只有 {len(targets)} 個，不足 {count} 個"
+        )
+    if count > total_words:
+        raise ValueError(f"PM target 數量 {count} 超過詞彙總長度 {total_words}")
+    words = rng.sample(targets, count)
+    positions = sorted(rng.sample(range(1, total_words + 1), count))
+    return dict(zip(words, positions))
+
+
+def generate_words_config_space(index, types, candidates, count, rng=None):
+    """為每個階段重新產生 space 區塊，總長度維持真假詞數加上 PM target 數
+
+    各階段的 PM target 互不重複，也不會與任何階段列出的真假詞重複。
+    """
+    rng = rng or random.Random()
+    used = set()
+    for stage_words in types.values():
+        word_types = [key for key in stage_words if key != "lexicon"]
+        for word_type in word_types[:2]:
+            used.update(stage_words[word_type])
+    for stage, stage_words in types.items():
+        if stage not in STAGE_SPECS:
+            continue
+        word_types = [key for key in stage_words if key != "lexicon"]
+        total_words = len(stage_words[word_types[0]]) + len(stage_words[word_types[1]])
+        total_words += count
+        stage_words[word_types[2]] = generate_space_targets(
+            index, stage, candidates, count, total_words, rng, used
+        )
+        used.update(stage_words[word_types[2]])
+    return types
+
+
+def main(argv):
+    usage = (
+        "用法:\n"
+        "  python zhuyin.py build <快取> [注音字典檔]\n"
+        "  python zhuyin.py audit <快取> <words_config.json>\n"
+        "  python zhuyin.py space <快取> <words_config.json> <候選詞檔> <每階段數量>"
+    )
+    if len(argv) < 3:
+        print(usage)
+        return 1
+
+    command, cache_path = argv[1], argv[2]
+    if command == "build":
+        index = load_or_build_index(cache_path, argv[3] if len(argv) > 3 else None)
+        print(f"注音索引共 {len(index.any_masks)} 字，已寫入 {cache_path}")
+        return 0
+
+    index = ZhuyinIndex.load(cache_path)
+    with open(argv[3], "r", encoding="utf-8") as file:
+        config_data = json.load(file)
+
+    if command == "audit":
+        report = audit_words_config(index, config_data["types"])
+        print(json.dumps(report, ensure_ascii=False, indent=4))
+        return 1 if report else 0
+
+    if command == "space" and len(argv) == 6:
+        with open(argv[4], "r", encoding="utf-8") as file:
+            candidates = [line.strip() for line in file if line.strip()]
+        generate_words_config_space(
+            index, config_data["types"], candidates, int(argv[5])
+        )
+        print(json.dumps(config_data, ensure_ascii=False, indent=4))
+        return 0
+
+    print(usage)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))